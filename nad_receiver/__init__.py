@@ -5,12 +5,16 @@ Not all receivers have all functions.
 Functions can be found on the NAD website: http://nadelectronics.com/software
 """
 
-import codecs
 import re
 import socket
 from time import sleep
-from typing import Any, Dict, Iterable, Optional, Union
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
 from nad_receiver.nad_commands import CMDS
+from nad_receiver.nad_history import StateHistory
+from nad_receiver.nad_keepalive import ConnectionMonitor, STATE_UNKNOWN, weak_callback
+from nad_receiver.nad_pool import ConnectionPool, PoolExhausted
+from nad_receiver.nad_tcp_protocol import (FrameBatch, REG_MUTE, REG_POLL, REG_POWER, REG_SOURCE,
+                                           REG_VOLUME, STATUS_REGISTERS, decode_frames, replies_complete)
 from nad_receiver.nad_transport import (NadTransport, SerialPortTransport, TelnetTransportWrapper,
                                         DEFAULT_TIMEOUT)
 
@@ -23,9 +27,66 @@ _LOGGER = logging.getLogger("nad_receiver")
 # _LOGGER.setLevel(logging.DEBUG)
 
 
+def _check_state_keys(target: Dict[str, Any], order: Sequence[str]) -> None:
+    unsupported = set(target) - set(order) - {'power'}
+    if unsupported:
+        raise ValueError('Unsupported state %s' % ', '.join(sorted(unsupported)))
+
+
+def _plan_state_changes(current: Dict[str, Any], target: Dict[str, Any],
+                        order: Sequence[str]) -> List[Tuple[str, Any]]:
+    """
+    Return the (key, value) changes needed to get from current to target.
+
+    Power on goes first and power off last. Nothing else is changed while the
+    unit is off and stays off. Unknown (None) current values are always sent.
+    """
+    power = target.get('power')
+    is_on = current.get('power')
+    changes: List[Tuple[str, Any]] = []
+    if power is True and is_on is not True:
+        changes.append(('power', True))
+        is_on = True
+    if is_on is not False:
+        changes.extend((key, target[key]) for key in order
+                       if key in target and (current.get(key) is None or target[key] != current[key]))
+    if power is False and is_on is not False:
+        changes.append(('power', False))
+    return changes
+
+
+def _normalize_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    # Sources compare as strings and volumes as floats, whatever the reply was
+    state = dict(state)
+    if state.get('source') is not None:
+        state['source'] = str(state['source'])
+    if state.get('volume') is not None:
+        state['volume'] = float(state['volume'])
+    return state
+
+
+def _parse_volume(value: Optional[str]) -> Optional[float]:
+    # Unlike main_volume() this also accepts 0 dB and above
+    if value is None:
+        return None
+    match = re.match(r"-?\d+(?:\.\d+)?", value.strip())
+    return float(match.group()) if match is not None else None
+
+
+def parse_on_off(value: Optional[str]) -> Optional[bool]:
+    """Return whether an On/Off reply is On, None when there was no reply."""
+    if value is None:
+        return None
+    return value.strip().lower() == 'on'
+
+
 class NADReceiver:
     """NAD receiver."""
     transport: NadTransport
+    history: Optional[StateHistory] = None
+
+    # Settable state for apply_state(), in the order it is applied
+    STATE_ORDER = ('source', 'volume', 'mute', 'speaker_a', 'speaker_b', 'tape_monitor')
 
     def __init__(self, serial_port: str) -> None:
         """Create RS232 connection."""
@@ -51,11 +112,25 @@ class NADReceiver:
         try:
             msg = self.transport.communicate(cmd)
             _LOGGER.debug(f"sent: '{cmd}' reply: '{msg}'")
+            if self.history is not None:
+                self.history.record_reply(msg)
             return msg.split('=')[1]
         except IndexError:
             pass
         return None
 
+    def enable_history(self, capacity: int = 1024) -> StateHistory:
+        """
+        Keep the last capacity power, volume, mute and source changes.
+
+        Both replies and the updates the receiver sends on its own, e.g.
+        after a change on the front panel, are recorded.
+        """
+        if self.history is None:
+            self.history = StateHistory(capacity)
+            self.transport.unsolicited = self.history.record_reply
+        return self.history
+
     def main_dimmer(self, operator: str, value: Optional[str] =None) -> Optional[str]:
         """Execute Main.Dimmer."""
         return self.exec_command('main', 'dimmer', operator, value)
@@ -173,6 +248,54 @@ class NADReceiver:
         """Execute Tuner.FM.Preset."""
         return self.exec_command('tuner', 'fm_preset', operator, value)
 
+    def _read_state(self, keys: Iterable[str]) -> Dict[str, Any]:
+        power = parse_on_off(self.main_power('?'))
+        state: Dict[str, Any] = {'power': power}
+        if power is False:
+            # No other function replies while the unit is off
+            return state
+        for key in keys:
+            if key == 'volume':
+                state[key] = _parse_volume(self.exec_command('main', 'volume', '?'))
+            elif key == 'source':
+                state[key] = self.main_source('?')
+            elif key != 'power':
+                state[key] = parse_on_off(self.exec_command('main', key, '?'))
+        return state
+
+    def apply_state(self, target: Dict[str, Any],
+                    current: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Bring the receiver into the target state with as few commands as possible.
+
+        target may contain 'power', 'mute', 'speaker_a', 'speaker_b' and
+        'tape_monitor' (bool), 'volume' (float dB) and 'source'. The current
+        state is queried unless a (cached) current state is given, settings
+        the model does not report are then skipped. Returns the part of
+        target that had to be sent.
+        """
+        _check_state_keys(target, self.STATE_ORDER)
+        target = _normalize_state(target)
+        if current is None:
+            current = self._read_state(target)
+            if current['power']:
+                unreported = [key for key in target if key != 'power' and current.get(key) is None]
+                if unreported:
+                    _LOGGER.debug("Skipping %s, the receiver does not report them", unreported)
+                for key in unreported:
+                    del target[key]
+        current = _normalize_state(current)
+
+        changes = _plan_state_changes(current, target, self.STATE_ORDER)
+        for key, value in changes:
+            if key == 'volume':
+                self.main_volume('=', '%g' % value)
+            elif key == 'source':
+                self.main_source('=', value)
+            else:
+                self.exec_command('main', key, '=', 'On' if value else 'Off')
+        return dict(changes)
+
 
 class NADReceiverTelnet(NADReceiver):
     """
@@ -182,9 +305,30 @@ class NADReceiverTelnet(NADReceiver):
     Known supported model: Nad T787.
     """
 
-    def __init__(self, host: str, port: int =23, timeout: int =DEFAULT_TIMEOUT):
-        """Create NADTelnet."""
-        self.transport = TelnetTransportWrapper(host, port, timeout)
+    transport: TelnetTransportWrapper
+
+    def __init__(self, host: str, port: int =23, timeout: int =DEFAULT_TIMEOUT,
+                 pool: Optional[ConnectionPool] = None):
+        """Create NADTelnet, connections are shared through pool when given."""
+        self.transport = TelnetTransportWrapper(host, port, timeout, pool)
+
+    def start_keepalive(self, min_interval: float = 5.0, max_interval: float = 60.0) -> ConnectionMonitor:
+        """
+        Probe the idle connection with Main.Model? and reconnect when it was dropped.
+
+        The probe interval doubles while the connection stays up and settles
+        below the idle timeout of the firmware once a probe fails.
+        """
+        return self.transport.start_keepalive(min_interval, max_interval)
+
+    def stop_keepalive(self) -> None:
+        """Stop the keepalive monitor."""
+        self.transport.stop_keepalive()
+
+    @property
+    def connection_state(self) -> str:
+        """Return 'connected', 'disconnected' or 'unknown' when not monitored."""
+        return self.transport.connection_state
 
 
 class NADReceiverTCP:
@@ -216,12 +360,50 @@ class NADReceiverTCP:
     PORT = 50001
     BUFFERSIZE = 1024
 
-    def __init__(self, host: str) -> None:
-        """Setup globals."""
+    # Settable state for apply_state(), in the order it is applied
+    STATE_ORDER = ('source', 'volume', 'muted')
+
+    def __init__(self, host: str, pool: Optional[ConnectionPool] = None) -> None:
+        """Setup globals, connections are kept open in pool when given."""
         self._host = host
+        self._pool = pool
+        self._monitor: Optional[ConnectionMonitor] = None
+        self.history: Optional[StateHistory] = None
 
-    def _send(self, message: str, read_reply: bool =False) -> Optional[str]:
-        """Send a command string to the amplifier."""
+    def __del__(self) -> None:
+        if self._monitor is not None:
+            self._monitor.stop()
+
+    def enable_history(self, capacity: int = 1024) -> StateHistory:
+        """
+        Keep the last capacity power, volume, mute and source changes seen in replies.
+
+        Volume is recorded as 0-200 like status() returns it.
+        """
+        if self.history is None:
+            self.history = StateHistory(capacity)
+        return self.history
+
+    def _to_status(self, registers: Dict[int, int]) -> Dict[str, Any]:
+        # Map register values to the keys and values status() returns
+        status: Dict[str, Any] = {}
+        if REG_VOLUME in registers:
+            status['volume'] = registers[REG_VOLUME]
+        if REG_POWER in registers:
+            status['power'] = registers[REG_POWER] == 1
+        if REG_MUTE in registers:
+            status['muted'] = registers[REG_MUTE] == 1
+        if REG_SOURCE in registers:
+            status['source'] = self.SOURCES_REVERSED.get(format(registers[REG_SOURCE], '02x'))
+        return status
+
+    def _record(self, frames: Iterable[Tuple[int, int]]) -> None:
+        if self.history is None:
+            return
+        for register, value in frames:
+            self.history.record_status(self._to_status({register: value}))
+
+    def _connect(self) -> Optional[socket.socket]:
         sock: socket.socket
         for tries in range(0, 3):
             try:
@@ -230,30 +412,164 @@ class NADReceiverTCP:
                 break
             except socket.timeout:
                 print("Socket connection timed out.")
+                self._report(False)
                 return None
             except (ConnectionError, BrokenPipeError):
                 if tries == 2:
                     print("socket connect failed.")
+                    self._report(False)
                     return None
                 sleep(0.1)
+        return sock
+
+    def _read_reply(self, sock: socket.socket, data: bytes) -> bytes:
+        # Read until every polled register has been answered. A dropped
+        # connection raises ConnectionError so the caller can discard it.
+        polled = [value for register, value in decode_frames(data) if register == REG_POLL]
+        sleep(0.1)
+        reply = b''
+        tries = 0
+        max_tries = 20
+        while tries < max_tries:
+            try:
+                chunk = sock.recv(self.BUFFERSIZE)
+            except socket.timeout:
+                break
+            if not chunk:
+                raise ConnectionResetError("Connection closed by device")
+            reply += chunk
+            if replies_complete(decode_frames(reply), polled):
+                break
+            tries += 1
+        return reply
+
+    def _drain(self, sock: socket.socket) -> bytes:
+        # A pooled connection may still hold replies to commands that were
+        # sent without reading them, those must not be taken for our reply
+        pending = b''
+        sock.setblocking(False)
+        try:
+            while True:
+                data = sock.recv(self.BUFFERSIZE)
+                if not data:
+                    raise ConnectionResetError("Connection closed by device")
+                pending += data
+        except BlockingIOError:
+            pass
+        finally:
+            sock.settimeout(5)
+        return pending
+
+    def _send_pooled(self, pool: ConnectionPool, data: bytes, read_reply: bool) -> Optional[bytes]:
+        for tries in range(0, 2):
+            try:
+                sock = pool.acquire((self._host, self.PORT),
+                                    lambda: socket.create_connection((self._host, self.PORT), timeout=5),
+                                    socket.socket.close)
+            except (PoolExhausted, OSError) as e:
+                _LOGGER.debug("No connection to %s: %s", self._host, e)
+                self._report(False)
+                return None
+            try:
+                # Late replies and unsolicited updates still tell the state
+                self._record(decode_frames(self._drain(sock)))
+                sock.send(data)
+            except OSError as e:
+                # The device dropped the idle connection, retry on a fresh one
+                _LOGGER.debug("Pooled connection to %s failed: %s", self._host, e)
+                pool.discard(sock)
+                continue
+            self._report(True)
+            try:
+                reply = self._read_reply(sock, data) if read_reply else b''
+            except OSError as e:
+                # The frames went out already, sending them again is not safe
+                _LOGGER.debug("Reading from %s failed: %s", self._host, e)
+                pool.discard(sock)
+                self._report(False)
+                return None
+            pool.release(sock)
+            return reply
+        self._report(False)
+        return None
+
+    def _send_bytes(self, data: bytes, read_reply: bool = False) -> Optional[bytes]:
+        """Send frames to the amplifier, return the reply or None when it could not be sent."""
+        if self._pool is not None:
+            return self._send_pooled(self._pool, data, read_reply)
+        sock = self._connect()
         if not sock:
             return None
         with sock:
-            sock.send(codecs.decode(message.encode(), encoding='hex_codec'))
-            if read_reply:
-                sleep(0.1)
-                reply = ''
-                tries = 0
-                max_tries = 20
-                while len(reply) < len(message) and tries < max_tries:
-                    try:
-                        reply += codecs.encode(sock.recv(self.BUFFERSIZE), 'hex')\
-                            .decode("utf-8")
-                        return reply
-                    except (ConnectionError, BrokenPipeError):
-                        pass
-                    tries += 1
-        return None
+            sock.send(data)
+            self._report(True)
+            if not read_reply:
+                return b''
+            try:
+                return self._read_reply(sock, data)
+            except ConnectionError as e:
+                _LOGGER.debug("Reading from %s failed: %s", self._host, e)
+                self._report(False)
+                return None
+
+    def _send(self, message: str, read_reply: bool =False) -> Optional[str]:
+        """Send a command string to the amplifier."""
+        reply = self._send_bytes(bytes.fromhex(message), read_reply)
+        if not reply:
+            return None
+        self._record(decode_frames(reply))
+        return reply.hex()
+
+    def send_batch(self, batch: FrameBatch) -> Optional[Dict[int, int]]:
+        """
+        Send all frames of batch in a single write.
+
+        When the batch polls registers the replies are read until every
+        polled register has been answered. Returns the last value seen for
+        each register in the reply, None when the device is unreachable.
+        """
+        reply = self._send_bytes(bytes(batch), read_reply=bool(batch.polled))
+        if reply is None:
+            return None
+        frames = decode_frames(reply)
+        self._record(frames)
+        return dict(frames)
+
+    def _report(self, success: bool) -> None:
+        if self._monitor is None:
+            return
+        if success:
+            self._monitor.touch()
+        else:
+            self._monitor.failed()
+
+    def _probe(self) -> bool:
+        return self._send(self.POLL_POWER, read_reply=True) is not None
+
+    def start_keepalive(self, min_interval: float = 5.0, max_interval: float = 60.0) -> ConnectionMonitor:
+        """
+        Poll the power state while idle to track whether the device is reachable.
+
+        Without a pool every command opens its own connection and the monitor
+        only reports the connection state. With a pool the probe keeps the
+        pooled connection warm and replaces it when the device dropped it.
+        """
+        if self._monitor is None:
+            self._monitor = ConnectionMonitor(weak_callback(self._probe), None, min_interval, max_interval)
+        self._monitor.start()
+        return self._monitor
+
+    def stop_keepalive(self) -> None:
+        """Stop the keepalive monitor."""
+        if self._monitor is not None:
+            self._monitor.stop()
+
+    @property
+    def connection_state(self) -> str:
+        """Return 'connected', 'disconnected' or 'unknown' when not monitored."""
+        if self._monitor is None:
+            return STATE_UNKNOWN
+        return self._monitor.state
 
     def status(self) -> Optional[Dict[str, Any]]:
         """
@@ -262,22 +578,11 @@ class NADReceiverTCP:
         Returns a dictionary with keys 'volume' (int 0-200) , 'power' (bool),
          'muted' (bool) and 'source' (str).
         """
-        nad_reply = self._send(self.POLL_VOLUME +
-                               self.POLL_POWER +
-                               self.POLL_MUTED +
-                               self.POLL_SOURCE, read_reply=True)
-        if nad_reply is None:
+        replies = self.send_batch(FrameBatch().poll_status())
+        if replies is None or not all(register in replies for register in STATUS_REGISTERS):
             return None
 
-        # split reply into parts of 10 characters
-        num_chars = 10
-        nad_status = [nad_reply[i:i + num_chars]
-                      for i in range(0, len(nad_reply), num_chars)]
-
-        return {'volume': int(nad_status[0][-2:], 16),
-                'power': nad_status[1][-2:] == '01',
-                'muted': nad_status[2][-2:] == '01',
-                'source': self.SOURCES_REVERSED[nad_status[3][-2:]]}
+        return self._to_status(replies)
 
     def power_off(self) -> None:
         """Power the device off."""
@@ -326,3 +631,45 @@ class NADReceiverTCP:
     def available_sources(self) -> Iterable[str]:
         """Return a list of available sources."""
         return list(self.SOURCES.keys())
+
+    def _check_state(self, target: Dict[str, Any]) -> None:
+        _check_state_keys(target, self.STATE_ORDER)
+        if 'source' in target and target['source'] not in self.SOURCES:
+            raise ValueError('Unknown source %s' % target['source'])
+        if 'volume' in target and not (isinstance(target['volume'], int) and 0 <= target['volume'] <= 200):
+            raise ValueError('Volume must be an integer 0-200, got %r' % target['volume'])
+
+    def apply_state(self, target: Dict[str, Any],
+                    current: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Bring the device into the target state with as few commands as possible.
+
+        target uses the keys of status(). The status is polled once unless a
+        (cached) current state is given. All commands after power on are sent
+        in a single write, power on itself needs a moment before the next one.
+        Returns the part of target that had to be sent, None when the device
+        did not reply.
+        """
+        self._check_state(target)
+        if current is None:
+            current = self.status()
+            if not current:
+                return None
+
+        changes = _plan_state_changes(current, target, self.STATE_ORDER)
+        batch = FrameBatch()
+        for key, value in changes:
+            if key == 'power' and value:
+                self._send(self.CMD_ON, read_reply=True)
+                sleep(0.5)  # Give NAD7050 some time before next command
+            elif key == 'power':
+                batch.power(False)
+            elif key == 'source':
+                batch.source(int(self.SOURCES[value], 16))
+            elif key == 'volume':
+                batch.volume(value)
+            elif key == 'muted':
+                batch.mute(value)
+        if batch:
+            self.send_batch(batch)
+        return dict(changes)
@@ -0,0 +1,239 @@
+"""
+Serve a fake NAD device over TCP or a serial pseudo terminal.
+
+Clients connect to these the same way they connect to a real device, e.g.
+NADReceiverTelnet('127.0.0.1', server.port) or NADReceiver(pty.port).
+"""
+
+import os
+import select
+import socket
+import socketserver
+import threading
+from typing import Callable, List, Optional, Set, Tuple, Type, TypeVar
+
+from nad_receiver.nad_tcp_protocol import (FRAME_SIZE, HEADER, REG_MUTE, REG_POLL, REG_POWER,
+                                           REG_POWERSAVE, REG_SOURCE, REG_VOLUME, encode_frame)
+from nad_receiver.nad_transport import NadTransport
+
+import logging
+
+logging.basicConfig()
+_LOGGER = logging.getLogger("nad_receiver.fake_server")
+
+
+def _split_commands(buffer: bytes) -> Tuple[List[str], bytes]:
+    """Split complete '\\r' or '\\n' terminated commands off the buffer."""
+    commands: List[str] = []
+    while True:
+        end = min((i for i in (buffer.find(b"\r"), buffer.find(b"\n")) if i >= 0), default=-1)
+        if end < 0:
+            return commands, buffer
+        command = buffer[:end].strip()
+        buffer = buffer[end + 1:]
+        if command:
+            commands.append(command.decode(errors="replace"))
+
+
+_T = TypeVar("_T", bound="_FakeServer")
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class _FakeServer:
+    """Serve requests handled by handler on a TCP port from a daemon thread."""
+
+    def __init__(self, handler: Type[socketserver.BaseRequestHandler], host: str, port: int) -> None:
+        self._server = _ThreadingTCPServer((host, port), handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def host(self) -> str:
+        return str(self._server.server_address[0])
+
+    @property
+    def port(self) -> int:
+        return int(self._server.server_address[1])
+
+    def start(self) -> None:
+        """Start serving from a daemon thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop serving and close the listening socket."""
+        if self._thread is not None:
+            # shutdown() waits for serve_forever(), it never returns if that did not run
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self: _T) -> _T:
+        self.start()
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.stop()
+
+
+class FakeTelnetServer(_FakeServer):
+    """
+    Serve a fake device on a TCP port like the telnet interface of a T787.
+
+    A banner with the model is sent on connect and replies are framed as
+    '\\nMain.Power=On\\r', both like the real firmware.
+    """
+
+    def __init__(self, transport: NadTransport, host: str = "127.0.0.1", port: int = 0) -> None:
+        communicate = transport.communicate
+        self._clients: Set[socket.socket] = set()
+        self._clients_lock = threading.Lock()
+        clients = self._clients
+        clients_lock = self._clients_lock
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self) -> None:
+                banner = communicate("Main.Model?")
+                if banner:
+                    self.request.sendall(f"\r{banner}\r\n".encode())
+                with clients_lock:
+                    clients.add(self.request)
+                try:
+                    self._serve()
+                finally:
+                    with clients_lock:
+                        clients.discard(self.request)
+
+            def _serve(self) -> None:
+                buffer = b""
+                while True:
+                    data = self.request.recv(1024)
+                    if not data:
+                        return
+                    commands, buffer = _split_commands(buffer + data)
+                    for command in commands:
+                        reply = communicate(command)
+                        if reply:
+                            with clients_lock:
+                                self.request.sendall(f"\n{reply}\r".encode())
+
+        super().__init__(Handler, host, port)
+
+    def notify(self, message: str) -> None:
+        """Send message to every connected client like an update after a front panel change."""
+        with self._clients_lock:
+            for client in self._clients:
+                client.sendall(f"\n{message}\r".encode())
+
+
+class FakeD7050Server(_FakeServer):
+    """
+    Serve a fake NAD D 7050 speaking the binary TCP protocol.
+
+    Polls are answered with the register value and writes are echoed with
+    the new value. Like the real device the source cannot be changed while
+    the unit is off.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.registers = {REG_SOURCE: 0, REG_VOLUME: 100, REG_POWERSAVE: 0, REG_POWER: 0, REG_MUTE: 0}
+        self.lock = threading.Lock()
+        execute = self._execute
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self) -> None:
+                buffer = b""
+                while True:
+                    data = self.request.recv(1024)
+                    if not data:
+                        return
+                    buffer += data
+                    reply = b""
+                    while len(buffer) >= FRAME_SIZE:
+                        if not buffer.startswith(HEADER):
+                            buffer = buffer[1:]
+                            continue
+                        reply += execute(buffer[3], buffer[4])
+                        buffer = buffer[FRAME_SIZE:]
+                    if reply:
+                        self.request.sendall(reply)
+
+        super().__init__(Handler, host, port)
+
+    def _execute(self, register: int, value: int) -> bytes:
+        """Apply a poll or write frame and return the reply frame, if any."""
+        with self.lock:
+            if register == REG_POLL:
+                register = value
+            elif register == REG_SOURCE and not self.registers[REG_POWER]:
+                return b""
+            elif register in self.registers:
+                self.registers[register] = value
+            if register not in self.registers:
+                return b""
+            return encode_frame(register, self.registers[register])
+
+
+class FakeSerialPort:
+    """
+    Serve a fake device on a pseudo terminal like the RS232 interface.
+
+    Replies are framed as '\\rMain.Power=On\\r'. Only available on POSIX.
+    """
+
+    def __init__(self, transport: NadTransport) -> None:
+        import pty
+        import tty
+
+        self._communicate: Callable[[str], str] = transport.communicate
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._stop_read, self._stop_write = os.pipe()
+        self._thread: Optional[threading.Thread] = None
+
+    def _serve(self) -> None:
+        buffer = b""
+        while True:
+            readable, _, _ = select.select([self._master, self._stop_read], [], [])
+            if self._stop_read in readable:
+                return
+            try:
+                data = os.read(self._master, 1024)
+            except OSError as e:
+                _LOGGER.debug("pty closed: %s", e)
+                return
+            commands, buffer = _split_commands(buffer + data)
+            for command in commands:
+                reply = self._communicate(command)
+                if reply:
+                    os.write(self._master, f"\r{reply}\r".encode())
+
+    def notify(self, message: str) -> None:
+        """Send message like an update after a front panel change."""
+        os.write(self._master, f"\r{message}\r".encode())
+
+    def start(self) -> None:
+        """Start serving from a daemon thread."""
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop serving and close the pseudo terminal."""
+        os.write(self._stop_write, b"x")
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for fd in (self._master, self._slave, self._stop_read, self._stop_write):
+            os.close(fd)
+
+    def __enter__(self) -> "FakeSerialPort":
+        self.start()
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.stop()
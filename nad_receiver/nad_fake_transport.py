@@ -1,86 +1,282 @@
+"""
+Fake NAD devices driven by declarative model profiles.
+
+A ModelProfile maps every command a model understands (e.g. 'Main.Power')
+to a property spec describing its values and the operators it accepts.
+FakeNadTransport executes commands against a profile the way the device
+does, so tests and applications can run without the hardware.
+"""
+
 from nad_receiver.nad_transport import NadTransport
 import re
-from typing import Callable, Optional
+import threading
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+ALL_OPERATORS = '+-=?'
+
+
+class Property:
+    """Base class of the property specs, the value is kept by FakeNadTransport."""
+
+    def __init__(self, default: Any, operators: str = ALL_OPERATORS) -> None:
+        self.default = default
+        self.operators = operators
+
+    def parse(self, value: str) -> Any:
+        """Return the value for an '=' command, None when the device would ignore it."""
+        return None
+
+    def step(self, current: Any, direction: int) -> Any:
+        """Return the value after a '+' (1) or '-' (-1) command."""
+        return current
+
+    def format(self, value: Any) -> str:
+        return str(value)
+
+    def reply(self, name: str, operator: str, value: Any) -> str:
+        return f"{name}={self.format(value)}"
+
+
+class Toggle(Property):
+    """On/Off property, '+' and '-' both flip it."""
+
+    def __init__(self, default: bool = False, operators: str = ALL_OPERATORS) -> None:
+        super().__init__(default, operators)
+
+    def parse(self, value: str) -> Optional[bool]:
+        if value not in ('On', 'Off'):
+            return None
+        return value == 'On'
+
+    def step(self, current: bool, direction: int) -> bool:
+        return not current
+
+    def format(self, value: bool) -> str:
+        return 'On' if value else 'Off'
+
+
+class Choice(Property):
+    """One of a list of values, '+' and '-' cycle through them."""
+
+    def __init__(self, values: Sequence[str], default: Optional[str] = None,
+                 operators: str = ALL_OPERATORS) -> None:
+        super().__init__(values[0] if default is None else default, operators)
+        self.values = list(values)
+
+    def parse(self, value: str) -> Optional[str]:
+        return value if value in self.values else None
+
+    def step(self, current: str, direction: int) -> str:
+        index = (self.values.index(current) + direction) % len(self.values)
+        return self.values[index]
+
+
+class Range(Property):
+    """Numeric value between minimum and maximum in steps of step."""
+
+    def __init__(self, minimum: float, maximum: float, step: float, default: float,
+                 decimals: int = 0, unit: str = '', operators: str = ALL_OPERATORS) -> None:
+        super().__init__(default, operators)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.step_size = step
+        self.decimals = decimals
+        self.unit = unit
+
+    def _clamp(self, value: float) -> float:
+        steps = round((value - self.minimum) / self.step_size)
+        value = self.minimum + steps * self.step_size
+        return round(min(max(value, self.minimum), self.maximum), self.decimals)
+
+    def parse(self, value: str) -> Optional[float]:
+        match = re.match(r"[+-]?\d+(?:\.\d+)?", value)
+        if match is None:
+            return None
+        return self._clamp(float(match.group()))
+
+    def step(self, current: float, direction: int) -> float:
+        return self._clamp(current + direction * self.step_size)
+
+    def format(self, value: float) -> str:
+        return f"{value:.{self.decimals}f}{self.unit}"
+
+
+class Stepper(Property):
+    """
+    Motorised control without position feedback.
+
+    '+' and '-' work and the device echoes the command back, but it has no
+    idea of the value so queries and '=' get no reply.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(None, '+-')
 
-class Fake_NAD_C_356BE_Transport(NadTransport):
-    """A fake NAD C 356BE device.
+    def reply(self, name: str, operator: str, value: Any) -> str:
+        return f"{name}{operator}"
+
+
+class Constant(Property):
+    """Read-only value such as the model name."""
+
+    def __init__(self, value: str) -> None:
+        super().__init__(value, '?')
+
+
+class Command(Property):
+    """Write-only command, the device echoes the value it was given."""
+
+    def __init__(self) -> None:
+        super().__init__('', '=')
+
+    def parse(self, value: str) -> Optional[str]:
+        return value if value else None
+
+
+class Preset(Range):
+    """Tuner preset, selecting one tunes the band and frequency stored in it."""
+
+    def __init__(self, stations: Sequence[float], frequency: str, band: str,
+                 operators: str = ALL_OPERATORS) -> None:
+        super().__init__(1, len(stations), 1, 1, operators=operators)
+        self.stations = list(stations)
+        self.frequency = frequency
+        self.band = band
+
+    def linked(self, value: float) -> Dict[str, Any]:
+        """Return the other properties that change when preset value is selected."""
+        return {self.frequency: self.stations[int(value) - 1], 'Tuner.Band': self.band}
+
+
+class ModelProfile:
+    """Declarative description of a NAD model."""
+
+    def __init__(self, model: str, version: str, properties: Dict[str, Property],
+                 available_when_off: Iterable[str] = ('Main.Power', 'Main.Model', 'Main.Version')) -> None:
+        self.model = model
+        self.version = version
+        self.properties = dict(properties)
+        self.properties.setdefault('Main.Model', Constant(model))
+        self.properties.setdefault('Main.Version', Constant(version))
+        # Every other command gets no reply while the unit is off
+        self.available_when_off = frozenset(available_when_off)
+
+
+def _tuner_properties() -> Dict[str, Property]:
+    am_stations = [530, 720, 1010, 1500]
+    fm_stations = [88.1, 91.5, 96.3, 101.1, 104.7, 107.9]
+    # Both bands start out tuned to their first preset
+    return {
+        'Tuner.Band': Choice(['FM', 'AM']),
+        'Tuner.AM.Frequency': Range(520, 1710, 10, am_stations[0]),
+        'Tuner.FM.Frequency': Range(87.5, 108.0, 0.1, fm_stations[0], decimals=1),
+        'Tuner.AM.Preset': Preset(am_stations, 'Tuner.AM.Frequency', 'AM'),
+        'Tuner.FM.Preset': Preset(fm_stations, 'Tuner.FM.Frequency', 'FM'),
+        'Tuner.FM.Mute': Toggle(),
+    }
+
+
+NAD_T748V2 = ModelProfile('T748v2', 'V1.10', {
+    'Main.Power': Toggle(),
+    'Main.Mute': Toggle(),
+    'Main.Volume': Range(-80, 10, 1, -40),
+    'Main.Dimmer': Toggle(),
+    'Main.IR': Command(),
+    'Main.ListeningMode': Choice(['None', 'Stereo', 'PLII Movie', 'PLII Music', 'Neo:6 Cinema',
+                                  'Neo:6 Music', 'EARS', 'Enhanced Stereo'], operators='+-'),
+    'Main.Sleep': Choice(['Off', '30', '60', '90'], operators='+-'),
+    'Main.Source': Choice(['1', '2', '3', '4', '5', '6', '7', '8', '9', '10']),
+    'Main.SpeakerA': Toggle(True),
+    'Main.SpeakerB': Toggle(),
+    'Main.Tape1': Toggle(),
+    **_tuner_properties(),
+})
+
+NAD_C_356BE = ModelProfile('C356BEE', 'V1.02', {
+    'Main.Power': Toggle(),
+    'Main.Mute': Toggle(),
+    'Main.Volume': Stepper(),
+    'Main.Source': Choice('CD TUNER DISC/MDC AUX TAPE2 MP'.split()),
+    'Main.SpeakerA': Toggle(True),
+    'Main.SpeakerB': Toggle(),
+    'Main.Tape1': Toggle(),
+})
+
+NAD_T787 = ModelProfile('T787', 'V2.08', {
+    'Main.Power': Toggle(),
+    'Main.Mute': Toggle(),
+    'Main.Volume': Range(-99, 19, 0.5, -48, decimals=1),
+    'Main.Dimmer': Choice(['Bright', 'Dim', 'Off']),
+    'Main.IR': Command(),
+    'Main.ListeningMode': Choice(['None', 'Stereo', 'Dolby Surround', 'DTS Neural:X', 'EARS',
+                                  'Enhanced Stereo', 'Stereo Downmix'], operators='+-'),
+    'Main.Sleep': Choice(['Off', '15', '30', '45', '60', '75', '90'], operators='+-'),
+    'Main.Source': Choice(['1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11']),
+    'Main.SpeakerA': Toggle(True),
+    'Main.SpeakerB': Toggle(),
+    'Main.Tape1': Toggle(),
+    **_tuner_properties(),
+})
+
+PROFILES = {profile.model: profile for profile in (NAD_T748V2, NAD_C_356BE, NAD_T787)}
+
+
+class FakeNadTransport(NadTransport):
+    """A fake NAD device behaving as described by a ModelProfile.
 
     Behaves just like the real device (although faster).
     This is convenient for testing or when integrating this
     library into other applications, such as Home Assistant.
     """
 
-    def __init__(self) -> None:
-        self._toggle = {
-            "Power": False,
-            "Mute": False,
-            "Tape1": False,
-            "SpeakerA": True,
-            "SpeakerB": False,
-        }
-        self._model = "C356BEE"
-        self._version = "V1.02"
-        self._sources = "CD TUNER DISC/MDC AUX TAPE2 MP".split()
-        self._source = "CD"
-        self._command_regex = re.compile(
-            r"(?P<component>\w+)\.(?P<function>\w+)(?P<operator>[=\?\+\-])(?P<value>.*)"
-        )
-
-    def _toggle_property(self, property: str, operator: str, value: str) -> str:
-        assert value in ["", "On", "Off"]
-        val = self._toggle[property]
-        if operator in ("+", "-"):
-            val = not val
-        if operator == "=":
-            val = value == "On"
-        self._toggle[property] = val
-        return "On" if val else "Off"
+    _command_regex = re.compile(
+        r"(?P<name>[A-Za-z0-9]+(?:\.[A-Za-z0-9]+)+)(?P<operator>[=\?\+\-])(?P<value>.*)"
+    )
+
+    def __init__(self, profile: ModelProfile) -> None:
+        self.profile = profile
+        self.state: Dict[str, Any] = {name: prop.default for name, prop in profile.properties.items()}
+        self.lock = threading.Lock()
 
     def communicate(self, command: str) -> str:
         match = self._command_regex.fullmatch(command)
-        if not match or match.group("component") != "Main":
+        if not match:
             return ""
-        component = match.group("component")
-        function = match.group("function")
+        name = match.group("name")
         operator = match.group("operator")
         value = match.group("value")
 
-        response: Callable[[Optional[str]], str] = lambda val: f"{component}.{function}{'=' + val if val else ''}"
+        prop = self.profile.properties.get(name)
+        if prop is None or operator not in prop.operators:
+            return ""
 
-        if function == "Version" and operator == "?":
-            return response(self._version)
-        if function == "Model" and operator == "?":
-            return response(self._model)
+        with self.lock:
+            if not self.state.get('Main.Power', True) and name not in self.profile.available_when_off:
+                return ""
 
-        if function == "Power":
-            return response(self._toggle_property(function, operator, value))
+            current = self.state[name]
+            if operator == "=":
+                current = prop.parse(value)
+                if current is None:
+                    return ""
+            elif operator in ("+", "-"):
+                current = prop.step(current, 1 if operator == "+" else -1)
 
-        if not self._toggle["Power"]:
-            # Except for power, all other functions return "" when power is off.
-            return ""
+            if operator != "?":
+                self._store(name, prop, current)
+            return prop.reply(name, operator, current)
 
-        if function in self._toggle.keys():
-            return response(self._toggle_property(function, operator, value))
-
-        if function == "Volume":
-            # this thing doesn't report volume, but increase/decrease works and we do get the original command back
-            if operator in ("+", "-"):
-                return response(None) + operator
-
-        if function == "Source":
-            index = self._sources.index(self._source)
-            assert index >= 0
-            if operator == "+":
-                index += 1
-            if operator == "-":
-                index -= 1
-            if operator == "=":
-                index = self._sources.index(value)
-            if index < 0:
-                index = len(self._sources) - 1
-            if index == len(self._sources):
-                index = 0
-            self._source = self._sources[index]
-            return response(self._source)
-
-        return ""
+    def _store(self, name: str, prop: Property, value: Any) -> None:
+        if not isinstance(prop, Command):
+            self.state[name] = value
+        if isinstance(prop, Preset):
+            for linked, linked_value in prop.linked(value).items():
+                if linked in self.state:
+                    self.state[linked] = linked_value
+
+
+class Fake_NAD_C_356BE_Transport(FakeNadTransport):
+    """A fake NAD C 356BE device."""
+
+    def __init__(self) -> None:
+        super().__init__(NAD_C_356BE)
@@ -0,0 +1,177 @@
+"""
+Compact history of the state changes seen for a receiver.
+
+StateHistory is a fixed-size ring buffer backed by three preallocated
+arrays, so its memory use does not grow once it is created. Each entry
+takes 17 bytes (a float64 timestamp, a uint8 property code and a float64
+value); the default of 1024 entries uses 17 KiB per receiver. Sources are
+stored as an index into a table of the distinct sources seen, which adds
+one small entry per source name.
+"""
+
+import re
+import threading
+import time
+from array import array
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+PROPERTIES = ('power', 'volume', 'mute', 'source')
+_CODES = {name: code for code, name in enumerate(PROPERTIES)}
+
+# Reply functions that map to a property, e.g. 'Main.Power=On'
+_REPLY_PROPERTIES = {'Main.Power': 'power', 'Main.Volume': 'volume',
+                     'Main.Mute': 'mute', 'Main.Source': 'source'}
+
+Entry = Tuple[float, str, Any]
+
+
+class StateHistory:
+    """Ring buffer of timestamped power, volume, mute and source changes."""
+
+    ENTRY_SIZE = 8 + 1 + 8
+
+    def __init__(self, capacity: int = 1024, clock: Callable[[], float] = time.time) -> None:
+        """Allocate room for capacity entries, the oldest are overwritten first."""
+        if capacity < 1:
+            raise ValueError('Capacity must be at least 1')
+        self.capacity = capacity
+        self._clock = clock
+        self._times = array('d', bytes(8 * capacity))
+        self._codes = array('B', bytes(capacity))
+        self._values = array('d', bytes(8 * capacity))
+        self._start = 0
+        self._count = 0
+        self._sources: List[Union[int, str]] = []
+        self._source_index: Dict[Union[int, str], int] = {}
+        self._latest: Dict[str, Any] = {}
+        # Replies arrive from the caller, keepalive and poller threads
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        """Return the size of the preallocated arrays in bytes."""
+        return self.capacity * self.ENTRY_SIZE
+
+    @property
+    def latest(self) -> Dict[str, Any]:
+        """Return the last recorded value of every property."""
+        with self._lock:
+            return dict(self._latest)
+
+    def _encode(self, name: str, value: Any) -> float:
+        if name != 'source':
+            return float(value)
+        index = self._source_index.get(value)
+        if index is None:
+            index = self._source_index[value] = len(self._sources)
+            self._sources.append(value)
+        return float(index)
+
+    def _decode(self, code: int, value: float) -> Any:
+        name = PROPERTIES[code]
+        if name in ('power', 'mute'):
+            return bool(value)
+        if name == 'source':
+            return self._sources[int(value)]
+        return value
+
+    def _time(self, index: int) -> float:
+        return self._times[(self._start + index) % self.capacity]
+
+    def record(self, name: str, value: Any, timestamp: Optional[float] = None) -> bool:
+        """Record value for property name if it changed, return whether it was recorded."""
+        if name not in _CODES:
+            raise ValueError('Unknown property %s' % name)
+        with self._lock:
+            if value is None or self._latest.get(name) == value:
+                return False
+            if timestamp is None:
+                timestamp = self._clock()
+            if self._count:
+                # Keep the timestamps sorted for the range queries
+                timestamp = max(timestamp, self._time(self._count - 1))
+
+            if self._count < self.capacity:
+                index = (self._start + self._count) % self.capacity
+                self._count += 1
+            else:
+                index = self._start
+                self._start = (self._start + 1) % self.capacity
+            self._times[index] = timestamp
+            self._codes[index] = _CODES[name]
+            self._values[index] = self._encode(name, value)
+            self._latest[name] = value
+            return True
+
+    def record_status(self, status: Dict[str, Any], timestamp: Optional[float] = None) -> None:
+        """Record the result of NADReceiverTCP.status()."""
+        for name, value in status.items():
+            name = 'mute' if name == 'muted' else name
+            if name in _CODES:
+                self.record(name, value, timestamp)
+
+    def record_reply(self, reply: str, timestamp: Optional[float] = None) -> None:
+        """
+        Record a reply line such as 'Main.Volume=-40'.
+
+        NADReceiver.enable_history() also routes the updates the RS232 and
+        telnet transports receive unsolicited here.
+        """
+        function, _, value = reply.strip().partition('=')
+        name = _REPLY_PROPERTIES.get(function)
+        if name is None or not value:
+            return
+        if name in ('power', 'mute'):
+            self.record(name, value.lower() == 'on', timestamp)
+        elif name == 'volume':
+            match = re.match(r"-?\d+(?:\.\d+)?", value.strip())
+            if match is not None:
+                self.record(name, float(match.group()), timestamp)
+        else:
+            self.record(name, int(value) if value.isdigit() else value, timestamp)
+
+    def _bisect(self, timestamp: float) -> int:
+        low, high = 0, self._count
+        while low < high:
+            mid = (low + high) // 2
+            if self._time(mid) < timestamp:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def between(self, start: float = float('-inf'), end: float = float('inf'),
+                name: Optional[str] = None) -> List[Entry]:
+        """Return the (timestamp, property, value) changes with start <= timestamp < end."""
+        code = None if name is None else _CODES[name]
+        entries = []
+        with self._lock:
+            for i in range(self._bisect(start), self._bisect(end)):
+                index = (self._start + i) % self.capacity
+                if code is None or self._codes[index] == code:
+                    entries.append((self._times[index], PROPERTIES[self._codes[index]],
+                                    self._decode(self._codes[index], self._values[index])))
+        return entries
+
+    def export(self) -> Dict[str, Any]:
+        """
+        Return all entries oldest first as arrays, without decoding them.
+
+        'time', 'property' and 'value' are parallel arrays. Property codes
+        index 'properties', source values index 'sources'.
+        """
+        with self._lock:
+            start = self._start
+            end = start + self._count
+
+            def ordered(data: array) -> array:
+                if end <= self.capacity:
+                    return data[start:end]
+                return data[start:] + data[:end - self.capacity]
+
+            return {'time': ordered(self._times), 'property': ordered(self._codes),
+                    'value': ordered(self._values), 'properties': PROPERTIES,
+                    'sources': list(self._sources)}
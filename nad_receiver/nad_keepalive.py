@@ -0,0 +1,159 @@
+"""
+Keepalive monitor for the network transports.
+
+NAD firmware silently drops idle telnet sessions. Without a monitor this is
+only noticed when the next command fails, so the caller gets an empty reply
+and the command after it pays for a fresh connect.
+"""
+
+import threading
+import time
+import weakref
+from typing import Callable, Optional
+
+import logging
+
+logging.basicConfig()
+_LOGGER = logging.getLogger("nad_receiver.keepalive")
+
+
+STATE_UNKNOWN = "unknown"
+STATE_CONNECTED = "connected"
+STATE_DISCONNECTED = "disconnected"
+
+
+def weak_callback(method: Callable[[], bool]) -> Callable[[], bool]:
+    """
+    Wrap a bound method without keeping its object alive.
+
+    The monitor thread would otherwise keep the transport from being
+    collected. Once the object is gone the callback returns False.
+    """
+    ref = weakref.WeakMethod(method)
+
+    def callback() -> bool:
+        bound = ref()
+        return bound() if bound is not None else False
+    return callback
+
+
+class ConnectionMonitor:
+    """
+    Probe an idle connection at an adaptive interval.
+
+    Each successful probe doubles the interval. When a probe fails right
+    after one at a shorter interval succeeded, the failed interval is
+    remembered and the interval stays strictly below it, so the monitor
+    settles just below the idle timeout of the device. The failed interval
+    is retried after RETRY_AFTER seconds, and twice as long after every
+    retry that fails again, in case the timeout was a one-off. Failures
+    without a preceding success, such as an outage, only trigger a
+    reconnect. Traffic reported through touch() postpones the next probe.
+    """
+
+    RETRY_AFTER = 3600.0
+
+    def __init__(self, probe: Callable[[], bool],
+                 reconnect: Optional[Callable[[], bool]] = None,
+                 min_interval: float = 5.0, max_interval: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        """Create a monitor, call start() to probe from a background thread."""
+        if not 0 < min_interval <= max_interval:
+            raise ValueError('Invalid keepalive interval %s-%s' % (min_interval, max_interval))
+        self._probe = probe
+        self._reconnect = reconnect
+        self._clock = clock
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self._ceiling = max_interval
+        self._last_success: Optional[float] = None
+        self._failed_interval: Optional[float] = None
+        self._retries = 0
+        self._retry_at = 0.0
+        self.state = STATE_UNKNOWN
+        self._last_activity = clock()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def touch(self) -> None:
+        """Record successful traffic on the connection."""
+        self._last_activity = self._clock()
+        self.state = STATE_CONNECTED
+
+    def failed(self) -> None:
+        """Record a failed exchange, the next check() probes right away."""
+        self.state = STATE_DISCONNECTED
+        self._last_activity = self._clock() - self.interval
+
+    def seconds_until_probe(self) -> float:
+        """Return the idle time left before the next probe is due."""
+        return max(0.0, self._last_activity + self.interval - self._clock())
+
+    def _probe_succeeded(self) -> None:
+        if self._failed_interval is not None and self.interval >= self._failed_interval:
+            # The retry made it, the idle timeout of the device went up
+            _LOGGER.debug("Keepalive probe after %.1fs idle succeeded, raising the ceiling", self.interval)
+            self._failed_interval = None
+            self._retries = 0
+            self._ceiling = self.max_interval
+        self._last_success = self.interval
+        self.interval = min(self.interval * 2, self._ceiling)
+        if (self._failed_interval is not None and self.interval >= self._ceiling
+                and self._clock() >= self._retry_at):
+            self.interval = self._failed_interval
+
+    def _probe_failed(self) -> None:
+        _LOGGER.debug("Keepalive probe failed after %.1fs idle", self.interval)
+        if self._last_success is not None and self._last_success < self.interval:
+            if self._failed_interval is not None and self.interval >= self._failed_interval:
+                self._retries += 1
+            if self._failed_interval is None or self.interval < self._failed_interval:
+                self._failed_interval = self.interval
+            self._ceiling = self._last_success
+            self._retry_at = self._clock() + self.RETRY_AFTER * 2 ** self._retries
+        self._last_success = None
+        self.interval = self.min_interval
+        if self._reconnect is not None and self._reconnect():
+            self.state = STATE_CONNECTED
+        else:
+            self.state = STATE_DISCONNECTED
+
+    def check(self) -> str:
+        """Probe the connection if it has been idle long enough and return the state."""
+        with self._lock:
+            if self.seconds_until_probe() > 0:
+                return self.state
+
+            if self._probe():
+                self._probe_succeeded()
+                self.state = STATE_CONNECTED
+            else:
+                self._probe_failed()
+            self._last_activity = self._clock()
+            return self.state
+
+    def _run(self) -> None:
+        while not self._stop.wait(max(self.seconds_until_probe(), 0.1)):
+            try:
+                self.check()
+            except Exception as e:
+                # Never let the monitor thread die on a misbehaving transport
+                _LOGGER.debug("Keepalive check failed: %s", e)
+
+    def start(self) -> None:
+        """Start probing from a daemon thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="nad_receiver.keepalive", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread."""
+        thread = self._thread
+        self._thread = None
+        self._stop.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
@@ -0,0 +1,218 @@
+"""
+Change-driven polling of the receiver state.
+
+Each property is polled at its own interval. A property that just changed
+is polled again at min_interval, every unchanged reply multiplies the
+interval by backoff up to max_interval. Model and version are read once.
+Subscribers only receive the properties that changed.
+"""
+
+import threading
+import time
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+from nad_receiver import NADReceiver, NADReceiverTCP, parse_on_off
+
+import logging
+
+logging.basicConfig()
+_LOGGER = logging.getLogger("nad_receiver.poller")
+
+
+# name: (reader, static, needs_power)
+# Except for power, model and version the RS232/telnet protocol gives
+# no reply while the unit is off, so those are not queried then.
+_RS232_PROPERTIES: Dict[str, Any] = {
+    'power': (lambda r: parse_on_off(r.main_power('?')), False, False),
+    'volume': (lambda r: r.main_volume('?'), False, True),
+    'mute': (lambda r: parse_on_off(r.main_mute('?')), False, True),
+    'source': (lambda r: r.main_source('?'), False, True),
+    'speaker_a': (lambda r: parse_on_off(r.main_speaker_a('?')), False, True),
+    'speaker_b': (lambda r: parse_on_off(r.main_speaker_b('?')), False, True),
+    'model': (lambda r: r.main_model('?'), True, False),
+    'version': (lambda r: r.main_version('?'), True, False),
+}
+
+# All TCP properties come from a single status() round trip
+_TCP_PROPERTIES = ('power', 'volume', 'muted', 'source')
+
+
+class _Property:
+    def __init__(self, name: str, read: Callable[[], Any], static: bool, needs_power: bool,
+                 shared: bool = False) -> None:
+        self.name = name
+        self.read = read
+        self.static = static
+        self.needs_power = needs_power
+        # Answered by the same round trip as every other shared property
+        self.shared = shared
+        self.value: Any = None
+        self.interval = 0.0
+        self.due = 0.0
+
+
+class StatePoller:
+    """Poll a NADReceiver or NADReceiverTCP and publish state deltas."""
+
+    def __init__(self, receiver: Union[NADReceiver, NADReceiverTCP],
+                 properties: Optional[Iterable[str]] = None,
+                 min_interval: float = 1.0, max_interval: float = 60.0,
+                 backoff: float = 2.0,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        """Create a poller, call poll() periodically or start() a background thread."""
+        if not 0 < min_interval <= max_interval:
+            raise ValueError('Invalid poll interval %s-%s' % (min_interval, max_interval))
+        if backoff < 1:
+            raise ValueError('Invalid backoff %s' % backoff)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self._clock = clock
+        self._subscribers: List[Callable[[Dict[str, Any]], None]] = []
+        self._status: Optional[Dict[str, Any]] = None
+        self._properties: Dict[str, _Property] = {}
+
+        if isinstance(receiver, NADReceiverTCP):
+            for name in _TCP_PROPERTIES:
+                self._properties[name] = _Property(
+                    name, partial(self._tcp_value, receiver, name), False, False, True)
+        else:
+            for name, (read, static, needs_power) in _RS232_PROPERTIES.items():
+                self._properties[name] = _Property(
+                    name, partial(read, receiver), static, needs_power)
+
+        if properties is not None:
+            wanted = set(properties)
+            unknown = wanted - set(self._properties)
+            if unknown:
+                raise ValueError('Unknown properties %s' % ', '.join(sorted(unknown)))
+            # power gates the other properties, so it is always polled
+            wanted.add('power')
+            self._properties = {name: prop for name, prop in self._properties.items() if name in wanted}
+
+        now = clock()
+        for prop in self._properties.values():
+            prop.due = now
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _tcp_value(self, receiver: NADReceiverTCP, name: str) -> Any:
+        if self._status is None:
+            self._status = receiver.status() or {}
+        return self._status.get(name)
+
+    @property
+    def state(self) -> Dict[str, Any]:
+        """Return the last known value of every property."""
+        return {name: prop.value for name, prop in self._properties.items()}
+
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None]) -> Callable[[], None]:
+        """Call callback with a dict of changed properties, returns a function to unsubscribe."""
+        self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def _is_off(self) -> bool:
+        return self._properties['power'].value is False
+
+    def _read(self, prop: _Property, now: float) -> bool:
+        value = prop.read()
+        changed = value is not None and value != prop.value
+        if changed:
+            prop.value = value
+            prop.interval = self.min_interval
+        else:
+            prop.interval = min(max(prop.interval * self.backoff, self.min_interval), self.max_interval)
+        if prop.static and value is not None:
+            prop.due = float('inf')
+        else:
+            prop.due = now + prop.interval
+        return changed
+
+    def _poll_power(self, now: float) -> bool:
+        # Return whether power changed, everything may have changed while
+        # the unit was off so turning on makes the other properties due
+        power = self._properties['power']
+        was_off = self._is_off()
+        if power.due > now or not self._read(power, now):
+            return False
+        if was_off and power.value:
+            for prop in self._properties.values():
+                if prop.needs_power:
+                    prop.interval = self.min_interval
+                    prop.due = now
+        return True
+
+    def _shared_changes(self, now: float, changes: Dict[str, Any]) -> Dict[str, Any]:
+        # The round trip also answered the shared properties that are not
+        # due yet, pick up their changes for free
+        shared: Dict[str, Any] = {}
+        for prop in self._properties.values():
+            if not prop.shared or prop.due <= now or prop.name in changes:
+                continue
+            value = prop.read()
+            if value is not None and value != prop.value:
+                prop.value = value
+                prop.interval = self.min_interval
+                prop.due = now + prop.interval
+                shared[prop.name] = value
+        return shared
+
+    def poll(self) -> Dict[str, Any]:
+        """Query the properties that are due, notify subscribers and return the changes."""
+        with self._lock:
+            now = self._clock()
+            self._status = None
+            changes: Dict[str, Any] = {}
+
+            if self._poll_power(now):
+                changes['power'] = self._properties['power'].value
+
+            for prop in self._properties.values():
+                if prop.name == 'power' or prop.due > now:
+                    continue
+                if prop.needs_power and self._is_off():
+                    continue
+                if self._read(prop, now):
+                    changes[prop.name] = prop.value
+
+            if self._status:
+                changes.update(self._shared_changes(now, changes))
+
+        if changes:
+            _LOGGER.debug("State changed: %s", changes)
+            for callback in list(self._subscribers):
+                callback(changes)
+        return changes
+
+    def next_poll_in(self) -> float:
+        """Return the number of seconds until the next property is due."""
+        off = self._is_off()
+        due = min(prop.due for prop in self._properties.values()
+                  if not (off and prop.needs_power))
+        return max(0.0, due - self._clock())
+
+    def _run(self) -> None:
+        while not self._stop.wait(min(self.next_poll_in(), self.max_interval)):
+            try:
+                self.poll()
+            except Exception as e:
+                _LOGGER.debug("Polling failed: %s", e)
+
+    def start(self) -> None:
+        """Start polling from a daemon thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="nad_receiver.poller", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread."""
+        thread = self._thread
+        self._thread = None
+        self._stop.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
@@ -0,0 +1,254 @@
+"""
+Connection pool shared by many telnet and TCP receivers.
+
+Connections are keyed by (host, port). The pool caps the number of open
+connections in total and per host, and closes the least recently used idle
+connection when a new one is needed or when it has been idle too long.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import logging
+
+logging.basicConfig()
+_LOGGER = logging.getLogger("nad_receiver.pool")
+
+PoolKey = Tuple[str, int]
+
+
+class PoolExhausted(Exception):
+    """No connection became available within the wait timeout."""
+
+
+class PoolStats(NamedTuple):
+    """Snapshot of the pool counters."""
+    opened: int
+    reused: int
+    evicted: int
+    discarded: int
+    open: int
+    idle: int
+
+    @property
+    def reuse_ratio(self) -> float:
+        """Return the fraction of acquires served by an already open connection."""
+        total = self.opened + self.reused
+        return self.reused / total if total else 0.0
+
+
+class _Entry:
+    def __init__(self, key: PoolKey, conn: Any, close: Callable[[Any], None]) -> None:
+        self.key = key
+        self.conn = conn
+        self.close = close
+        self.last_used = 0.0
+
+
+class ConnectionPool:
+    """
+    Bounded pool of connections with LRU idle eviction.
+
+    Connections idle longer than idle_timeout are only closed by acquire()
+    and evict_idle(). Call start() to evict them from a background thread,
+    otherwise a mostly idle fleet keeps its sockets open.
+    """
+
+    def __init__(self, max_connections: int = 64, max_per_host: int = 1,
+                 idle_timeout: float = 300.0, wait_timeout: float = 5.0,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        """Create an empty pool."""
+        if max_connections < 1 or max_per_host < 1:
+            raise ValueError('Pool limits must be at least 1')
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self._clock = clock
+        self._cond = threading.Condition()
+        # Idle connections, least recently used first
+        self._idle: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._entries: Dict[int, _Entry] = {}
+        self._open: Dict[PoolKey, int] = {}
+        self._total = 0
+        self._opened = 0
+        self._reused = 0
+        self._evicted = 0
+        self._discarded = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def stats(self) -> PoolStats:
+        with self._cond:
+            return PoolStats(self._opened, self._reused, self._evicted, self._discarded,
+                             self._total, len(self._idle))
+
+    def open_connections(self, key: PoolKey) -> int:
+        """Return the number of open connections to key."""
+        with self._cond:
+            return self._open.get(key, 0)
+
+    def _unreserve(self, key: PoolKey) -> None:
+        self._open[key] -= 1
+        if not self._open[key]:
+            del self._open[key]
+        self._total -= 1
+        self._cond.notify_all()
+
+    def _forget(self, entry: _Entry) -> None:
+        self._idle.pop(id(entry.conn), None)
+        del self._entries[id(entry.conn)]
+        self._unreserve(entry.key)
+
+    def _close(self, entries: List[_Entry]) -> None:
+        # Called without holding the lock, closing may block on the network
+        for entry in entries:
+            _LOGGER.debug("Close pooled connection to %s:%s", *entry.key)
+            try:
+                entry.close(entry.conn)
+            except Exception as e:
+                _LOGGER.debug("Closing pooled connection failed: %s", e)
+
+    def _expired(self) -> List[_Entry]:
+        deadline = self._clock() - self.idle_timeout
+        expired = [entry for entry in self._idle.values() if entry.last_used <= deadline]
+        for entry in expired:
+            self._forget(entry)
+            self._evicted += 1
+        return expired
+
+    def _reuse(self, key: PoolKey) -> Optional[_Entry]:
+        # Most recently used first, it is the least likely to have been dropped
+        for entry in reversed(self._idle.values()):
+            if entry.key == key:
+                del self._idle[id(entry.conn)]
+                self._reused += 1
+                return entry
+        return None
+
+    def _reserve(self, key: PoolKey, to_close: List[_Entry]) -> bool:
+        # Reserve a slot for a new connection to key, the least recently used
+        # idle connection makes room when the pool is full
+        if self._open.get(key, 0) >= self.max_per_host:
+            return False
+        if self._total >= self.max_connections and self._idle:
+            lru = next(iter(self._idle.values()))
+            self._forget(lru)
+            self._evicted += 1
+            to_close.append(lru)
+        if self._total >= self.max_connections:
+            return False
+        # The connection is opened without the lock
+        self._open[key] = self._open.get(key, 0) + 1
+        self._total += 1
+        return True
+
+    def acquire(self, key: PoolKey, factory: Callable[[], Any], close: Callable[[Any], None]) -> Any:
+        """
+        Return an idle connection to key or open a new one with factory.
+
+        Blocks up to wait_timeout when the limits are reached and raises
+        PoolExhausted when no connection became available.
+        """
+        to_close: List[_Entry] = []
+        deadline = self._clock() + self.wait_timeout
+        try:
+            with self._cond:
+                while True:
+                    to_close.extend(self._expired())
+                    entry = self._reuse(key)
+                    if entry is not None:
+                        return entry.conn
+                    if self._reserve(key, to_close):
+                        break
+
+                    remaining = deadline - self._clock()
+                    if remaining <= 0:
+                        raise PoolExhausted('No connection to %s:%s available' % key)
+                    self._cond.wait(remaining)
+        finally:
+            self._close(to_close)
+
+        try:
+            conn = factory()
+        except BaseException:
+            with self._cond:
+                self._unreserve(key)
+            raise
+
+        with self._cond:
+            self._entries[id(conn)] = _Entry(key, conn, close)
+            self._opened += 1
+        return conn
+
+    def release(self, conn: Any) -> None:
+        """Return a healthy connection to the pool."""
+        with self._cond:
+            entry = self._entries[id(conn)]
+            entry.last_used = self._clock()
+            self._idle[id(conn)] = entry
+            self._cond.notify_all()
+
+    def discard(self, conn: Any) -> None:
+        """Close a broken connection and free its slot."""
+        with self._cond:
+            entry = self._entries[id(conn)]
+            self._forget(entry)
+            self._discarded += 1
+        self._close([entry])
+
+    @contextmanager
+    def connection(self, key: PoolKey, factory: Callable[[], Any],
+                   close: Callable[[Any], None]) -> Iterator[Any]:
+        """Acquire a connection, release it afterwards or discard it on an exception."""
+        conn = self.acquire(key, factory, close)
+        try:
+            yield conn
+        except BaseException:
+            self.discard(conn)
+            raise
+        self.release(conn)
+
+    def evict_idle(self) -> int:
+        """Close the connections that have been idle longer than idle_timeout."""
+        with self._cond:
+            expired = self._expired()
+        self._close(expired)
+        return len(expired)
+
+    def close_all(self) -> None:
+        """Close every idle connection."""
+        with self._cond:
+            idle = list(self._idle.values())
+            for entry in idle:
+                self._forget(entry)
+                self._evicted += 1
+        self._close(idle)
+
+    def _run(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            evicted = self.evict_idle()
+            if evicted:
+                _LOGGER.debug("Evicted %d idle connections", evicted)
+
+    def start(self, interval: Optional[float] = None) -> None:
+        """Evict idle connections every interval seconds, idle_timeout / 2 by default."""
+        if self._thread is not None:
+            return
+        if interval is None:
+            interval = max(self.idle_timeout / 2, 1.0)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="nad_receiver.pool", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background eviction."""
+        thread = self._thread
+        self._thread = None
+        self._stop.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
@@ -0,0 +1,93 @@
+"""
+Frames of the binary protocol used by the NAD D 7050 over TCP.
+
+Every frame is five bytes: the header 00 01 02, a register and a value.
+Writing register 02 polls the register given as value, the device answers
+with a frame holding the register and its current value.
+"""
+
+from typing import Dict, Iterable, List, Tuple
+
+HEADER = b"\x00\x01\x02"
+FRAME_SIZE = len(HEADER) + 2
+
+REG_POLL = 0x02
+REG_SOURCE = 0x03
+REG_VOLUME = 0x04
+REG_POWERSAVE = 0x07
+REG_POWER = 0x09
+REG_MUTE = 0x0a
+
+STATUS_REGISTERS = (REG_VOLUME, REG_POWER, REG_MUTE, REG_SOURCE)
+
+
+def encode_frame(register: int, value: int) -> bytes:
+    """Return the frame setting register to value."""
+    return HEADER + bytes((register, value))
+
+
+def decode_frames(data: bytes) -> List[Tuple[int, int]]:
+    """
+    Return the (register, value) pairs of all complete frames in data.
+
+    Bytes that do not start a frame are skipped, so a reply that starts
+    in the middle of a frame resynchronises on the next header.
+    """
+    frames = []
+    start = data.find(HEADER)
+    while 0 <= start <= len(data) - FRAME_SIZE:
+        frames.append((data[start + 3], data[start + 4]))
+        start = data.find(HEADER, start + FRAME_SIZE)
+    return frames
+
+
+class FrameBatch:
+    """Command and poll frames that are sent to the device in a single write."""
+
+    def __init__(self) -> None:
+        self._frames: List[bytes] = []
+        self.polled: List[int] = []
+
+    def __bytes__(self) -> bytes:
+        return b"".join(self._frames)
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def command(self, register: int, value: int) -> "FrameBatch":
+        self._frames.append(encode_frame(register, value))
+        return self
+
+    def poll(self, *registers: int) -> "FrameBatch":
+        for register in registers:
+            self.command(REG_POLL, register)
+            self.polled.append(register)
+        return self
+
+    def poll_status(self) -> "FrameBatch":
+        """Poll volume, power, mute and source."""
+        return self.poll(*STATUS_REGISTERS)
+
+    def power(self, on: bool) -> "FrameBatch":
+        if on:
+            return self.command(REG_POWER, 1)
+        # Leave power save mode before switching off
+        return self.command(REG_POWERSAVE, 0).poll(REG_POWERSAVE).command(REG_POWER, 0)
+
+    def volume(self, volume: int) -> "FrameBatch":
+        """Set the volume, 0-200."""
+        if not 0 <= volume <= 200:
+            raise ValueError('Volume out of range %s' % volume)
+        return self.command(REG_VOLUME, volume)
+
+    def mute(self, muted: bool) -> "FrameBatch":
+        return self.command(REG_MUTE, 1 if muted else 0)
+
+    def source(self, source: int) -> "FrameBatch":
+        return self.command(REG_SOURCE, source)
+
+
+def replies_complete(replies: Iterable[Tuple[int, int]], polled: Iterable[int]) -> bool:
+    """Return whether every polled register has been answered."""
+    answered: Dict[int, int] = dict(replies)
+    return all(register in answered for register in polled)
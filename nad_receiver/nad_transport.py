@@ -1,9 +1,12 @@
 import abc
+import re
 import serial  # type: ignore
 from telnetlib3.telnetlib import Telnet  # type: ignore
 import threading
 
-from typing import Optional
+from typing import Callable, Optional
+from nad_receiver.nad_keepalive import ConnectionMonitor, STATE_UNKNOWN, weak_callback
+from nad_receiver.nad_pool import ConnectionPool, PoolExhausted
 
 import logging
 
@@ -14,7 +17,21 @@ _LOGGER = logging.getLogger("nad_receiver.transport")
 DEFAULT_TIMEOUT = 1
 
 
+def _dispatch_unsolicited(callback: Optional[Callable[[str], None]], data: bytes) -> None:
+    """Pass the complete lines in data to callback, an unfinished last line is dropped."""
+    if callback is None:
+        return
+    for line in re.split(b"[\r\n]", data)[:-1]:
+        line = line.strip()
+        if line:
+            callback(line.decode(errors="replace"))
+
+
 class NadTransport(abc.ABC):
+    # Called with every line the device sends on its own, e.g. after a
+    # change on the front panel. Without it those lines are dropped.
+    unsolicited: Optional[Callable[[str], None]] = None
+
     @abc.abstractmethod
     def communicate(self, command: str) -> str:
         pass
@@ -42,7 +59,10 @@ class SerialPortTransport(NadTransport):
         with self.lock:
             self._open_connection()
 
+            # Anything waiting was not sent in reply to this command
+            pending = self.ser.read(self.ser.in_waiting) if self.ser.in_waiting else b""
             self.ser.reset_input_buffer()
+            _dispatch_unsolicited(self.unsolicited, pending)
             self.ser.write(f"\r{command}\r".encode("utf-8"))
             # To get complete messages, always read until we get '\r'
             # Messages will be of the form '\rMESSAGE\r' which
@@ -59,16 +79,28 @@ class SerialPortTransport(NadTransport):
 # a way that e.g. Home Assistant will not
 # receive any exceptions
 class TelnetTransportWrapper(NadTransport):
-    def __init__(self, host: str, port: int, timeout: int) -> None:
-        """Create NADTelnet."""
+    # Cheap query every firmware answers, also when the unit is off
+    PROBE_COMMAND = "Main.Model?"
+
+    def __init__(self, host: str, port: int, timeout: int, pool: Optional[ConnectionPool] = None) -> None:
+        """Create NADTelnet, connections are shared through pool when given."""
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        # The connection used when there is no pool
         self.nad_telnet = TelnetTransport(host, port, timeout)
+        self.pool = pool
+        self.lock = threading.Lock()
+        self.monitor: Optional[ConnectionMonitor] = None
 
     def __del__(self) -> None:
         """Destroy NADTelnet."""
+        if self.monitor:
+            self.monitor.stop()
         if self.nad_telnet:
             del self.nad_telnet
 
-    def _pre_read(self) -> bool:
+    def _pre_read(self, nad_telnet: "TelnetTransport") -> bool:
         # On initial connection
         # some firmwares sends nothing
         # some firmwares sends e.g. b'\rMain.Model=T787\r\n'
@@ -76,12 +108,12 @@ class TelnetTransportWrapper(NadTransport):
         #    including blank lines between data lines
         # At least clear the row "\rMain.Model=T787\r\n"
         try:
-            self.nad_telnet.read_until("\n".encode())
+            nad_telnet.read_until("\n".encode())
             # Could raise eg. EOFError, UnicodeError
         except EOFError as cc:
             # Connection closed, no recovery
             _LOGGER.debug("Connection closed: %s", cc)
-            self.nad_telnet.close_connection()
+            nad_telnet.close_connection()
             return False
         except UnicodeError as ue:
             # Some unicode error, but connection is open
@@ -90,35 +122,114 @@ class TelnetTransportWrapper(NadTransport):
 
         return True
 
-    def _open_connection(self) -> bool:
-        if self.nad_telnet.is_open():
+    def _open_connection(self, nad_telnet: "TelnetTransport") -> bool:
+        if nad_telnet.is_open():
             return True
 
         try:
-            self.nad_telnet.open_connection()
+            nad_telnet.open_connection()
         except Exception as e:
             _LOGGER.debug("Connection failed to open: %s" % e)
             return False
 
-        return self._pre_read()
+        return self._pre_read(nad_telnet)
 
-    def communicate(self, cmd: str) -> str:
+    def _communicate(self, nad_telnet: "TelnetTransport", cmd: str) -> str:
         rsp = ""
-        if not self._open_connection():
+        if not self._open_connection(nad_telnet):
+            self._report(False)
             return rsp
 
         try:
-            rsp = self.nad_telnet.communicate(cmd)
+            nad_telnet.unsolicited = self.unsolicited
+            rsp = nad_telnet.communicate(cmd)
         except (EOFError,BrokenPipeError, ConnectionResetError) as cc:
             # Connection closed
             _LOGGER.debug("Connection closed: %s", cc)
-            self.nad_telnet.close_connection()
+            nad_telnet.close_connection()
+            self._report(False)
         except UnicodeError as ue:
             # Some unicode error, but connection is open
             _LOGGER.debug("Unicode error: %s", ue)
 
+        if rsp:
+            self._report(True)
         return rsp
 
+    def _acquire(self) -> Optional["TelnetTransport"]:
+        if self.pool is None:
+            return self.nad_telnet
+        try:
+            return self.pool.acquire((self.host, self.port),
+                                     lambda: TelnetTransport(self.host, self.port, self.timeout),
+                                     TelnetTransport.close_connection)
+        except PoolExhausted as e:
+            _LOGGER.debug("No pooled connection: %s", e)
+            self._report(False)
+            return None
+
+    def _release(self, nad_telnet: "TelnetTransport") -> None:
+        if self.pool is None:
+            return
+        if nad_telnet.is_open():
+            self.pool.release(nad_telnet)
+        else:
+            self.pool.discard(nad_telnet)
+
+    def communicate(self, cmd: str) -> str:
+        with self.lock:
+            nad_telnet = self._acquire()
+            if nad_telnet is None:
+                return ""
+            try:
+                return self._communicate(nad_telnet, cmd)
+            finally:
+                self._release(nad_telnet)
+
+    def _report(self, success: bool) -> None:
+        if self.monitor is None:
+            return
+        if success:
+            self.monitor.touch()
+        else:
+            self.monitor.failed()
+
+    def probe(self) -> bool:
+        """Send a cheap query and return whether the device answered."""
+        return self.communicate(self.PROBE_COMMAND) != ""
+
+    def reconnect(self) -> bool:
+        """Drop the current connection and open a fresh one."""
+        with self.lock:
+            nad_telnet = self._acquire()
+            if nad_telnet is None:
+                return False
+            try:
+                nad_telnet.close_connection()
+                return self._open_connection(nad_telnet)
+            finally:
+                self._release(nad_telnet)
+
+    def start_keepalive(self, min_interval: float = 5.0, max_interval: float = 60.0) -> ConnectionMonitor:
+        """Keep the connection warm by probing it while idle."""
+        if self.monitor is None:
+            self.monitor = ConnectionMonitor(weak_callback(self.probe), weak_callback(self.reconnect),
+                                             min_interval, max_interval)
+        self.monitor.start()
+        return self.monitor
+
+    def stop_keepalive(self) -> None:
+        """Stop probing the connection."""
+        if self.monitor is not None:
+            self.monitor.stop()
+
+    @property
+    def connection_state(self) -> str:
+        """Return the connection state as last seen by the keepalive monitor."""
+        if self.monitor is None:
+            return STATE_UNKNOWN
+        return self.monitor.state
+
 
 class TelnetTransport(NadTransport):
     """
@@ -128,6 +239,9 @@ class TelnetTransport(NadTransport):
     Known supported model: Nad T787.
     """
 
+    # At most this many unsolicited lines are passed on before the reply
+    MAX_UNSOLICITED = 8
+
     def __init__(self, host: str, port: int, timeout: int) -> None:
         """Create NADTelnet."""
         self.telnet: Optional[Telnet] = None
@@ -168,11 +282,22 @@ class TelnetTransport(NadTransport):
         if not self.telnet:
             raise Exception("Connection is closed")
 
+        # Lines that arrived since the last reply were sent unsolicited
+        _dispatch_unsolicited(self.unsolicited, self.telnet.read_very_eager())
+
         _LOGGER.debug("Sending command: '%s'", cmd)
         self.telnet.write(f"\n{cmd}\r".encode())
 
         # Notice NAD response to command ends with \r and starts with \n
         # E.g. b'\nMain.Power=On\r'
-        rsp = self.telnet.read_until(b"\r", self.timeout)
-        _LOGGER.debug("Read response: '%s'", str(rsp))
-        return rsp.strip().decode()
+        function = re.split(r"[=?+-]", cmd, maxsplit=1)[0].lower()
+        for _ in range(self.MAX_UNSOLICITED + 1):
+            rsp = self.telnet.read_until(b"\r", self.timeout)
+            _LOGGER.debug("Read response: '%s'", str(rsp))
+            line = rsp.strip().decode()
+            # An update the device sent on its own may arrive before the reply
+            if self.unsolicited is None or not line or not rsp.endswith(b"\r") or \
+                    line.lower().startswith(function):
+                break
+            self.unsolicited(line)
+        return line
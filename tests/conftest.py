@@ -0,0 +1,41 @@
+from typing import List
+
+import pytest
+
+from nad_receiver.nad_fake_transport import Fake_NAD_C_356BE_Transport
+
+
+class FakeClock:
+    """Clock for the time based classes, advances by step on every reading."""
+
+    def __init__(self, step: float = 0.0) -> None:
+        self.now = 0.0
+        self.step = step
+
+    def __call__(self) -> float:
+        self.now += self.step
+        return self.now
+
+
+class RecordingTransport(Fake_NAD_C_356BE_Transport):
+    """Fake C 356BE that records every command sent to it."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.sent: List[str] = []
+
+    def communicate(self, command: str) -> str:
+        self.sent.append(command)
+        return super().communicate(command)
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    """Clock that stands still until the test moves now or sets step."""
+    return FakeClock()
+
+
+@pytest.fixture
+def recording_transport() -> RecordingTransport:
+    """Fake C 356BE transport, the commands sent are in its sent list."""
+    return RecordingTransport()
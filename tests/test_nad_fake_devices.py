@@ -0,0 +1,82 @@
+import os
+import pytest  # type: ignore
+
+import nad_receiver
+from nad_receiver.nad_commands import CMDS
+from nad_receiver.nad_fake_server import FakeSerialPort, FakeTelnetServer
+from nad_receiver.nad_fake_transport import (FakeNadTransport, NAD_T748V2, NAD_T787, PROFILES)
+
+ON = "On"
+OFF = "Off"
+
+
+class FakeReceiver(nad_receiver.NADReceiver):
+    def __init__(self, transport: FakeNadTransport) -> None:
+        self.transport = transport
+
+
+def test_profiles_cover_all_commands() -> None:
+    commands = {function['cmd'] for domain in CMDS.values() for function in domain.values()}
+    assert set(NAD_T748V2.properties) >= commands
+    assert set(PROFILES) == {'T748v2', 'C356BEE', 'T787'}
+
+
+def test_T748v2() -> None:
+    receiver = FakeReceiver(FakeNadTransport(NAD_T748V2))
+    assert receiver.main_model("?") == "T748v2"
+    assert receiver.main_volume("?") is None
+    assert receiver.tuner_band("?") is None
+
+    assert receiver.main_power("=", ON) == ON
+    assert receiver.main_volume("=", "-30") == -30.0
+    assert receiver.main_volume("+") == -29.0
+    assert receiver.main_volume("=", "-200") == -80.0
+    assert receiver.main_source("=", "4") == 4
+    assert receiver.main_source("-") == 3
+    assert receiver.main_listeningmode("+") == "Stereo"
+    assert receiver.main_sleep("-") == "90"
+    assert receiver.main_ir("=", "12") == "12"
+    assert receiver.main_dimmer("+") == ON
+
+    transport = receiver.transport
+    assert transport.communicate("Tuner.FM.Preset?") == "Tuner.FM.Preset=1"
+    assert transport.communicate("Tuner.FM.Frequency?") == "Tuner.FM.Frequency=88.1"
+    assert transport.communicate("Tuner.AM.Preset?") == "Tuner.AM.Preset=1"
+    assert transport.communicate("Tuner.AM.Frequency?") == "Tuner.AM.Frequency=530"
+
+    assert receiver.tuner_fm_preset("=", "4") == "4"
+    assert receiver.tuner_band("?") == "FM"
+    assert receiver.tuner_fm_frequency("+") == "101.2"
+    assert receiver.tuner_am_preset("=", "2") == "2"
+    assert receiver.tuner_band("?") == "AM"
+    assert receiver.tuner_am_frequency("-") == "710"
+    assert receiver.tuner_fm_mute("=", ON) == ON
+
+    # Invalid values are ignored by the device
+    assert receiver.main_mute("=", "Maybe") is None
+    assert receiver.main_source("=", "42") is None
+
+
+def test_telnet_server() -> None:
+    with FakeTelnetServer(FakeNadTransport(NAD_T787)) as server:
+        receiver = nad_receiver.NADReceiverTelnet(server.host, server.port)
+        assert receiver.main_model("?") == "T787"
+        assert receiver.main_power("=", ON) == ON
+        assert receiver.main_volume("=", "-20.5") == -20.5
+        assert receiver.main_volume("-") == -21.0
+        receiver.transport.nad_telnet.close_connection()
+
+
+def test_server_stop_without_start() -> None:
+    server = FakeTelnetServer(FakeNadTransport(NAD_T787))
+    server.stop()
+
+
+@pytest.mark.skipif(os.name != "posix", reason="needs a pseudo terminal")
+def test_serial_port() -> None:
+    with FakeSerialPort(FakeNadTransport(NAD_T748V2)) as pty:
+        receiver = nad_receiver.NADReceiver(pty.port)
+        assert receiver.main_power("=", ON) == ON
+        assert receiver.main_source("=", "2") == 2
+        assert receiver.main_model("?") == "T748v2"
+        receiver.transport.ser.close()  # type: ignore
@@ -0,0 +1,117 @@
+import os
+import threading
+from typing import Any
+
+import pytest  # type: ignore
+
+import nad_receiver
+from nad_receiver.nad_fake_server import FakeD7050Server, FakeSerialPort, FakeTelnetServer
+from nad_receiver.nad_fake_transport import FakeNadTransport, NAD_T748V2, NAD_T787
+from nad_receiver.nad_history import StateHistory
+
+
+class Fake_T748v2(nad_receiver.NADReceiver):
+    def __init__(self) -> None:
+        self.transport = FakeNadTransport(NAD_T748V2)
+
+
+def test_ring_buffer_keeps_latest_changes(clock: Any) -> None:
+    clock.step = 1
+    history = StateHistory(capacity=4, clock=clock)
+    assert history.nbytes == 4 * 17
+
+    assert history.record('power', True)
+    assert not history.record('power', True)
+    for volume in (-40.0, -39.0, -38.0):
+        history.record('volume', volume)
+    history.record('source', 'AUX')
+
+    # The power change at t=1 has been overwritten
+    assert len(history) == 4
+    assert history.between() == [(2.0, 'volume', -40.0), (3.0, 'volume', -39.0),
+                                 (4.0, 'volume', -38.0), (5.0, 'source', 'AUX')]
+    assert history.between(3, 5) == [(3.0, 'volume', -39.0), (4.0, 'volume', -38.0)]
+    assert history.between(name='source') == [(5.0, 'source', 'AUX')]
+    assert history.latest == {'power': True, 'volume': -38.0, 'source': 'AUX'}
+
+    exported = history.export()
+    assert list(exported['time']) == [2.0, 3.0, 4.0, 5.0]
+    assert list(exported['property']) == [1, 1, 1, 3]
+    assert list(exported['value']) == [-40.0, -39.0, -38.0, 0.0]
+    assert exported['sources'] == ['AUX']
+
+
+def test_history_from_replies() -> None:
+    receiver = Fake_T748v2()
+    history = receiver.enable_history()
+
+    receiver.main_power('=', 'On')
+    receiver.main_volume('=', '-30')
+    receiver.main_volume('?')
+    receiver.main_source('=', '3')
+    receiver.main_mute('+')
+    history.record_reply('Main.Volume=-25')  # e.g. an unsolicited update
+
+    assert [(name, value) for _, name, value in history.between()] == \
+        [('power', True), ('volume', -30.0), ('source', 3), ('mute', True), ('volume', -25.0)]
+
+
+def test_history_from_unsolicited_telnet_updates() -> None:
+    with FakeTelnetServer(FakeNadTransport(NAD_T787)) as server:
+        receiver = nad_receiver.NADReceiverTelnet(server.host, server.port)
+        history = receiver.enable_history()
+        assert receiver.main_power('=', 'On') == 'On'
+
+        # Whether it is still waiting or crosses the next command, an
+        # update is recorded and not taken for the reply
+        server.notify('Main.Volume=-25')
+        assert receiver.main_mute('?') == 'Off'
+        server.notify('Main.Volume=-20')
+        assert receiver.main_source('?') == 1
+        receiver.transport.nad_telnet.close_connection()
+
+    assert [(name, value) for _, name, value in history.between()] == \
+        [('power', True), ('volume', -25.0), ('mute', False), ('volume', -20.0), ('source', 1)]
+
+
+@pytest.mark.skipif(os.name != "posix", reason="needs a pseudo terminal")
+def test_history_from_unsolicited_serial_updates() -> None:
+    with FakeSerialPort(FakeNadTransport(NAD_T748V2)) as pty:
+        receiver = nad_receiver.NADReceiver(pty.port)
+        history = receiver.enable_history()
+        assert receiver.main_power('=', 'On') == 'On'
+        pty.notify('Main.Volume=-25')
+        assert receiver.main_mute('?') == 'Off'
+        receiver.transport.ser.close()  # type: ignore
+
+    assert history.latest == {'power': True, 'volume': -25.0, 'mute': False}
+
+
+def test_history_from_tcp_status(monkeypatch: Any) -> None:
+    with FakeD7050Server() as server:
+        receiver = nad_receiver.NADReceiverTCP(server.host)
+        monkeypatch.setattr(receiver, 'PORT', server.port)
+        history = receiver.enable_history(16)
+        receiver.status()
+        receiver.status()
+        assert history.latest == {'volume': 100, 'power': False, 'mute': False, 'source': 'Coaxial 1'}
+        assert len(history) == 4
+
+
+def test_concurrent_records_keep_buffer_ordered(clock: Any) -> None:
+    clock.step = 1
+    history = StateHistory(capacity=64, clock=clock)
+
+    def record(name: str) -> None:
+        for i in range(2000):
+            history.record(name, float(i))
+
+    threads = [threading.Thread(target=record, args=(name,)) for name in ('volume', 'power')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    times = list(history.export()['time'])
+    assert len(history) == len(times) == 64
+    assert times == sorted(times)
@@ -0,0 +1,153 @@
+import gc
+from typing import Any, List
+
+from nad_receiver.nad_keepalive import (ConnectionMonitor, STATE_CONNECTED, STATE_DISCONNECTED,
+                                        STATE_UNKNOWN)
+from nad_receiver.nad_transport import TelnetTransportWrapper
+
+
+def test_probe_interval_backs_off_and_learns_idle_timeout(clock: Any) -> None:
+    idle_timeout = 25.0
+    last_traffic = [0.0]
+    reconnects: List[float] = []
+
+    def probe() -> bool:
+        alive = clock.now - last_traffic[0] < idle_timeout
+        if alive:
+            last_traffic[0] = clock.now
+        return alive
+
+    def reconnect() -> bool:
+        reconnects.append(clock.now)
+        last_traffic[0] = clock.now
+        return True
+
+    monitor = ConnectionMonitor(probe, reconnect, min_interval=5, max_interval=60, clock=clock)
+    assert monitor.state == STATE_UNKNOWN
+
+    # Not idle long enough, nothing is sent
+    clock.now = 4
+    assert monitor.check() == STATE_UNKNOWN
+
+    intervals = []
+    for _ in range(8):
+        clock.now += monitor.seconds_until_probe()
+        intervals.append(monitor.interval)
+        assert monitor.check() == STATE_CONNECTED
+
+    # 5, 10, 20 succeed, 40 hits the idle timeout and reconnects, then the
+    # interval never exceeds the learned ceiling of 20 seconds again
+    assert intervals == [5, 10, 20, 40, 5, 10, 20, 20]
+    assert len(reconnects) == 1
+
+
+def test_traffic_postpones_probe_and_failure_probes_immediately(clock: Any) -> None:
+    probes: List[float] = []
+
+    def probe() -> bool:
+        probes.append(clock.now)
+        return False
+
+    monitor = ConnectionMonitor(probe, None, min_interval=5, max_interval=60, clock=clock)
+
+    clock.now = 4
+    monitor.touch()
+    clock.now = 8
+    assert monitor.check() == STATE_CONNECTED
+    assert probes == []
+
+    monitor.failed()
+    assert monitor.state == STATE_DISCONNECTED
+    assert monitor.seconds_until_probe() == 0
+    assert monitor.check() == STATE_DISCONNECTED
+    assert probes == [8]
+
+
+def test_outage_does_not_pin_interval(clock: Any) -> None:
+    outage = [True]
+
+    monitor = ConnectionMonitor(lambda: not outage[0], None, min_interval=5, max_interval=60, clock=clock)
+
+    for _ in range(3):
+        clock.now += monitor.seconds_until_probe()
+        assert monitor.check() == STATE_DISCONNECTED
+
+    outage[0] = False
+    intervals = []
+    for _ in range(6):
+        clock.now += monitor.seconds_until_probe()
+        intervals.append(monitor.interval)
+        assert monitor.check() == STATE_CONNECTED
+    assert intervals == [5, 10, 20, 40, 60, 60]
+
+
+class IdleTimeoutDevice:
+    """Drop the session when it was idle for idle_timeout seconds."""
+
+    def __init__(self, clock: Any, idle_timeout: float) -> None:
+        self.clock = clock
+        self.idle_timeout = idle_timeout
+        self.last_traffic = clock.now
+        self.dropped: List[float] = []
+
+    def probe(self) -> bool:
+        if self.clock.now - self.last_traffic >= self.idle_timeout:
+            self.dropped.append(self.clock.now)
+            return False
+        self.last_traffic = self.clock.now
+        return True
+
+    def reconnect(self) -> bool:
+        self.last_traffic = self.clock.now
+        return True
+
+
+def test_fixed_idle_timeout_fails_only_while_learning(clock: Any) -> None:
+    device = IdleTimeoutDevice(clock, 15)
+    monitor = ConnectionMonitor(device.probe, device.reconnect, min_interval=5, max_interval=60, clock=clock)
+
+    intervals = []
+    while clock.now < 3000:
+        clock.now += monitor.seconds_until_probe()
+        intervals.append(monitor.interval)
+        assert monitor.check() == STATE_CONNECTED
+
+    # Only the probe that found the timeout failed, after that the
+    # interval stays below it
+    assert device.dropped == [35]
+    assert intervals[:5] == [5, 10, 20, 5, 10]
+    assert set(intervals[5:]) == {10}
+
+
+def test_failed_interval_is_retried_with_backoff(clock: Any) -> None:
+    device = IdleTimeoutDevice(clock, 15)
+    monitor = ConnectionMonitor(device.probe, device.reconnect, min_interval=5, max_interval=60, clock=clock)
+    monitor.RETRY_AFTER = 100
+
+    while clock.now < 500:
+        clock.now += monitor.seconds_until_probe()
+        monitor.check()
+    # Retried at least 100 and then 200 seconds after the previous failure
+    assert device.dropped == [35, 160, 385]
+
+    # The timeout went up, the next retry raises the ceiling
+    device.idle_timeout = 30
+    device.dropped.clear()
+    intervals = []
+    while clock.now < 900:
+        clock.now += monitor.seconds_until_probe()
+        intervals.append(monitor.interval)
+        monitor.check()
+    # 20 succeeds on the retry, 40 fails and becomes the new limit
+    assert device.dropped == [850]
+    assert intervals[-7:] == [10, 20, 40, 5, 10, 20, 20]
+
+
+def test_wrapper_with_keepalive_can_be_collected() -> None:
+    wrapper = TelnetTransportWrapper("localhost", 23, 1)
+    monitor = wrapper.start_keepalive(min_interval=3600, max_interval=3600)
+    assert monitor._thread is not None
+    thread = monitor._thread
+    del wrapper
+    gc.collect()
+    assert not thread.is_alive()
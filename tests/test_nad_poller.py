@@ -0,0 +1,68 @@
+from typing import Any, Dict, List
+
+import nad_receiver
+from nad_receiver.nad_poller import StatePoller
+from nad_receiver.nad_transport import NadTransport
+
+
+class Fake_NAD_C_356BE(nad_receiver.NADReceiver):
+    def __init__(self, transport: NadTransport) -> None:
+        self.transport = transport
+
+
+def test_poller_emits_deltas_and_skips_queries_while_off(clock: Any, recording_transport: Any) -> None:
+    transport = recording_transport
+    receiver = Fake_NAD_C_356BE(transport)
+    poller = StatePoller(receiver, properties=['source', 'mute', 'model'],
+                         min_interval=1, max_interval=8, clock=clock)
+    updates: List[Dict[str, Any]] = []
+    poller.subscribe(updates.append)
+
+    assert poller.poll() == {'power': False, 'model': 'C356BEE'}
+    assert transport.sent == ['Main.Power?', 'Main.Model?']
+
+    # Power is off, only power is queried and it backs off
+    transport.sent.clear()
+    for _ in range(4):
+        clock.now += poller.next_poll_in()
+        assert poller.poll() == {}
+    assert transport.sent == ['Main.Power?'] * 4
+    assert poller.next_poll_in() == 8
+
+    receiver.main_power('=', 'On')
+    receiver.main_source('=', 'AUX')
+    transport.sent.clear()
+    clock.now += poller.next_poll_in()
+    assert poller.poll() == {'power': True, 'source': 'AUX', 'mute': False}
+    assert transport.sent == ['Main.Power?', 'Main.Mute?', 'Main.Source?']
+
+    # Unchanged properties back off, the model is never queried again
+    transport.sent.clear()
+    clock.now += 1
+    assert poller.poll() == {}
+    clock.now += 1
+    assert poller.poll() == {}
+    assert 'Main.Model?' not in transport.sent
+
+    assert updates == [{'power': False, 'model': 'C356BEE'},
+                       {'power': True, 'source': 'AUX', 'mute': False}]
+
+
+def test_poller_tcp_uses_one_status_round_trip(monkeypatch: Any, clock: Any) -> None:
+    receiver = nad_receiver.NADReceiverTCP('localhost')
+    calls: List[int] = []
+    status = {'volume': 100, 'power': True, 'muted': False, 'source': 'Optical 1'}
+
+    def fake_status() -> Dict[str, Any]:
+        calls.append(1)
+        return dict(status)
+    monkeypatch.setattr(receiver, 'status', fake_status)
+    poller = StatePoller(receiver, clock=clock)
+
+    assert poller.poll() == status
+    assert len(calls) == 1
+
+    status['volume'] = 90
+    clock.now += poller.next_poll_in()
+    assert poller.poll() == {'volume': 90}
+    assert len(calls) == 2
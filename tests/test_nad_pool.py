@@ -0,0 +1,98 @@
+import time
+from typing import Any, List
+
+import pytest  # type: ignore
+
+import nad_receiver
+from nad_receiver.nad_fake_server import FakeTelnetServer
+from nad_receiver.nad_fake_transport import FakeNadTransport, NAD_T787
+from nad_receiver.nad_pool import ConnectionPool, PoolExhausted
+
+
+class Connections:
+    def __init__(self) -> None:
+        self.opened: List[str] = []
+        self.closed: List[str] = []
+
+    def factory(self, name: str):  # type: ignore
+        def open_connection() -> List[str]:
+            self.opened.append(name)
+            return [name]
+        return open_connection
+
+    def close(self, conn: List[str]) -> None:
+        self.closed.append(conn[0])
+
+
+def test_pool_reuses_and_evicts_least_recently_used(clock: Any) -> None:
+    conns = Connections()
+    pool = ConnectionPool(max_connections=2, max_per_host=1, idle_timeout=60,
+                          wait_timeout=0, clock=clock)
+
+    a = pool.acquire(('a', 23), conns.factory('a'), conns.close)
+    pool.release(a)
+    assert pool.acquire(('a', 23), conns.factory('a'), conns.close) is a
+
+    # Per host limit reached while a is busy
+    with pytest.raises(PoolExhausted):
+        pool.acquire(('a', 23), conns.factory('a'), conns.close)
+    pool.release(a)
+
+    clock.now = 1
+    with pool.connection(('b', 23), conns.factory('b'), conns.close):
+        pass
+    clock.now = 2
+    # Global cap reached, a is the least recently used idle connection
+    with pool.connection(('c', 23), conns.factory('c'), conns.close):
+        pass
+    assert conns.closed == ['a']
+    assert pool.open_connections(('b', 23)) == 1
+
+    clock.now = 61.5
+    assert pool.evict_idle() == 1
+    assert conns.closed == ['a', 'b']
+
+    stats = pool.stats
+    assert (stats.opened, stats.reused, stats.evicted, stats.open, stats.idle) == (3, 1, 2, 1, 1)
+    assert stats.reuse_ratio == 0.25
+
+
+def test_pool_discards_connection_on_error() -> None:
+    conns = Connections()
+    pool = ConnectionPool()
+    with pytest.raises(RuntimeError):
+        with pool.connection(('a', 23), conns.factory('a'), conns.close):
+            raise RuntimeError()
+    assert conns.closed == ['a']
+    assert pool.stats.open == 0
+    assert pool.stats.discarded == 1
+
+
+def test_telnet_receivers_share_pool() -> None:
+    pool = ConnectionPool()
+    with FakeTelnetServer(FakeNadTransport(NAD_T787)) as server:
+        first = nad_receiver.NADReceiverTelnet(server.host, server.port, pool=pool)
+        second = nad_receiver.NADReceiverTelnet(server.host, server.port, pool=pool)
+        assert first.main_power("=", "On") == "On"
+        assert second.main_power("?") == "On"
+        assert second.main_model("?") == "T787"
+        assert pool.stats.opened == 1
+        assert pool.stats.reused == 2
+        pool.close_all()
+
+
+def test_pool_evicts_idle_connections_in_background() -> None:
+    conns = Connections()
+    pool = ConnectionPool(idle_timeout=0)
+    with pool.connection(('a', 23), conns.factory('a'), conns.close):
+        pass
+    pool.start(interval=0.01)
+    try:
+        for _ in range(100):
+            if conns.closed:
+                break
+            time.sleep(0.01)
+    finally:
+        pool.stop()
+    assert conns.closed == ['a']
+    assert pool.stats.open == 0
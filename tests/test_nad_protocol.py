@@ -1,8 +1,9 @@
 import re
 import pytest  # type: ignore
+from typing import Any, List
 
 import nad_receiver
-from nad_receiver.nad_fake_transport import Fake_NAD_C_356BE_Transport
+from nad_receiver.nad_fake_transport import Fake_NAD_C_356BE_Transport, FakeNadTransport, NAD_T748V2
 
 ON = "On"
 OFF = "Off"
@@ -14,6 +15,11 @@ class Fake_NAD_C_356BE(nad_receiver.NADReceiver):
         self.transport = Fake_NAD_C_356BE_Transport()
 
 
+class Fake_T748v2(nad_receiver.NADReceiver):
+    def __init__(self) -> None:
+        self.transport = FakeNadTransport(NAD_T748V2)
+
+
 @pytest.mark.parametrize(
     ("response", "expected"),
     [
@@ -108,3 +114,85 @@ def test_NAD_C_356BE() -> None:
     assert receiver.main_speaker_b("?") == OFF
 
     assert receiver.main_power("=", OFF) == OFF
+
+
+def test_apply_state_sends_minimal_commands(recording_transport: Any) -> None:
+    receiver = Fake_NAD_C_356BE()
+    transport = receiver.transport = recording_transport
+
+    # Off and staying off, only power is queried
+    assert receiver.apply_state({'source': 'AUX', 'mute': True}) == {}
+    assert transport.sent == ['Main.Power?']
+
+    transport.sent.clear()
+    assert receiver.apply_state({'power': True, 'source': 'AUX', 'speaker_b': True}) == \
+        {'power': True, 'source': 'AUX', 'speaker_b': True}
+    assert transport.sent == ['Main.Power?', 'Main.Power=On', 'Main.Source=AUX', 'Main.SpeakerB=On']
+
+    transport.sent.clear()
+    assert receiver.apply_state({'power': True, 'source': 'AUX', 'speaker_b': False, 'mute': False}) == \
+        {'speaker_b': False}
+    assert transport.sent == ['Main.Power?', 'Main.Source?', 'Main.SpeakerB?', 'Main.Mute?',
+                              'Main.SpeakerB=Off']
+
+    # A cached state saves the queries, power off goes last
+    transport.sent.clear()
+    assert receiver.apply_state({'power': False, 'mute': True},
+                                current={'power': True, 'mute': False}) == {'mute': True, 'power': False}
+    assert transport.sent == ['Main.Mute=On', 'Main.Power=Off']
+
+    with pytest.raises(ValueError):
+        receiver.apply_state({'bass': 3})
+
+    # Also rejected before anything is queried while the unit is on
+    receiver.main_power('=', ON)
+    transport.sent.clear()
+    with pytest.raises(ValueError):
+        receiver.apply_state({'power': True, 'bass': 3})
+    assert transport.sent == []
+
+
+def test_apply_state_volume_not_resent() -> None:
+    receiver = Fake_T748v2()
+    receiver.main_power('=', ON)
+
+    # 0 dB and above are parsed too, so an unchanged volume is not sent again
+    assert receiver.apply_state({'volume': 5}) == {'volume': 5.0}
+    assert receiver.apply_state({'volume': 5}) == {}
+    assert receiver.apply_state({'volume': 0}) == {'volume': 0.0}
+    assert receiver.exec_command('main', 'volume', '?') == '0'
+
+
+def test_apply_state_skips_unreported_settings(recording_transport: Any) -> None:
+    receiver = Fake_NAD_C_356BE()
+    transport = receiver.transport = recording_transport
+    receiver.main_power('=', ON)
+    transport.sent.clear()
+
+    # The C 356BE only steps the volume and never reports it
+    assert receiver.apply_state({'volume': -20, 'mute': True}) == {'mute': True}
+    assert transport.sent == ['Main.Power?', 'Main.Volume?', 'Main.Mute?', 'Main.Mute=On']
+
+
+def test_tcp_apply_state_single_write(monkeypatch: pytest.MonkeyPatch) -> None:
+    receiver = nad_receiver.NADReceiverTCP('localhost')
+    sent: List[str] = []
+    monkeypatch.setattr(receiver, '_send_bytes', lambda data, read_reply=False: sent.append(data.hex()))
+    current = {'volume': 100, 'power': True, 'muted': True, 'source': 'Optical 1'}
+
+    assert receiver.apply_state({'source': 'Optical 1', 'volume': 120, 'muted': False}, current) == \
+        {'volume': 120, 'muted': False}
+    assert sent == [receiver.CMD_VOLUME + '78' + receiver.CMD_UNMUTE]
+
+    # Never change the source while off
+    sent.clear()
+    assert receiver.apply_state({'source': 'Computer'}, dict(current, power=False)) == {}
+    assert sent == []
+
+    with pytest.raises(ValueError):
+        receiver.apply_state({'source': 'Radio'}, current)
+
+    # Checked before power on is sent
+    with pytest.raises(ValueError):
+        receiver.apply_state({'power': True, 'volume': 120.0}, dict(current, power=False))
+    assert sent == []
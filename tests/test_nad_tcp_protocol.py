@@ -0,0 +1,61 @@
+import socketserver
+import threading
+from typing import Any
+
+import nad_receiver
+from nad_receiver.nad_fake_server import FakeD7050Server
+from nad_receiver.nad_pool import ConnectionPool
+from nad_receiver.nad_tcp_protocol import (FrameBatch, REG_MUTE, REG_POWER, REG_SOURCE, REG_VOLUME,
+                                           decode_frames, encode_frame)
+
+
+def test_decode_frames_resynchronises() -> None:
+    data = b"\x02\x04" + encode_frame(REG_VOLUME, 0x78) + encode_frame(REG_POWER, 1) + b"\x00\x01"
+    assert decode_frames(data) == [(REG_VOLUME, 0x78), (REG_POWER, 1)]
+
+
+def test_frame_batch_matches_protocol_constants() -> None:
+    receiver = nad_receiver.NADReceiverTCP
+    batch = FrameBatch().poll_status()
+    assert bytes(batch).hex() == (receiver.POLL_VOLUME + receiver.POLL_POWER +
+                                  receiver.POLL_MUTED + receiver.POLL_SOURCE)
+    assert bytes(FrameBatch().power(False)).hex() == receiver.CMD_POWERSAVE + receiver.CMD_OFF
+    assert bytes(FrameBatch().volume(120).mute(True)).hex() == \
+        receiver.CMD_VOLUME + '78' + receiver.CMD_MUTE
+
+
+def test_send_batch_single_round_trip(monkeypatch: Any) -> None:
+    with FakeD7050Server() as server:
+        pool = ConnectionPool()
+        receiver = nad_receiver.NADReceiverTCP(server.host, pool=pool)
+        monkeypatch.setattr(receiver, 'PORT', server.port)
+
+        assert receiver.status() == {'volume': 100, 'power': False, 'muted': False, 'source': 'Coaxial 1'}
+
+        replies = receiver.send_batch(FrameBatch().power(True).source(2).volume(90).mute(True).poll_status())
+        assert replies == {REG_POWER: 1, REG_SOURCE: 2, REG_VOLUME: 90, REG_MUTE: 1}
+
+        assert receiver.apply_state({'source': 'Computer', 'muted': False}) == {'source': 'Computer', 'muted': False}
+        assert receiver.status() == {'volume': 90, 'power': True, 'muted': False, 'source': 'Computer'}
+        assert pool.stats.opened == 1
+        pool.close_all()
+
+
+def test_pooled_connection_dropped_while_reading_is_discarded(monkeypatch: Any) -> None:
+    class Handler(socketserver.BaseRequestHandler):
+        def handle(self) -> None:
+            self.request.recv(1024)  # and hang up without a reply
+
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        pool = ConnectionPool()
+        receiver = nad_receiver.NADReceiverTCP("127.0.0.1", pool=pool)
+        monkeypatch.setattr(receiver, 'PORT', server.server_address[1])
+
+        assert receiver.status() is None
+        assert pool.stats.discarded == 1
+        assert pool.stats.open == 0
+    finally:
+        server.shutdown()
+        server.server_close()